@@ -1,6 +1,104 @@
+from functools import partial
+
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from ingredients.models import Ingredient
+        from recipes.models import Recipe, RecipeIngredient
+        from rest_framework.authtoken.models import Token
+        from users.models import CustomUser
+        from .authentication import (
+            revoke_token_on_commit,
+            revoke_user_tokens_on_commit
+        )
+        from .db import (
+            pin_to_primary_on_author_change,
+            pin_to_primary_on_commit
+        )
+        from .cache import (
+            INGREDIENTS,
+            RECIPES,
+            USERS,
+            invalidate_on_commit,
+            invalidate_on_user_change,
+            invalidate_recipe_on_commit
+        )
+
+        receivers = [
+            (Recipe, invalidate_on_commit, (RECIPES,)),
+            (RecipeIngredient, invalidate_on_commit, (RECIPES,)),
+            (Ingredient, invalidate_on_commit, (RECIPES, INGREDIENTS)),
+            (CustomUser, invalidate_on_user_change, (RECIPES, USERS)),
+        ]
+        for model, handler, scopes in receivers:
+            receiver = partial(handler, scopes)
+            for action, signal in (
+                ('save', post_save), ('delete', post_delete)
+            ):
+                signal.connect(
+                    receiver,
+                    sender=model,
+                    weak=False,
+                    dispatch_uid=f'api_cache_{action}_{model.__name__}'
+                )
+        m2m_changed.connect(
+            partial(invalidate_on_commit, (RECIPES,)),
+            sender=Recipe.ingredients.through,
+            weak=False,
+            dispatch_uid='api_cache_recipe_ingredients'
+        )
+
+        for model in (Recipe, RecipeIngredient):
+            for action, signal in (
+                ('save', post_save), ('delete', post_delete)
+            ):
+                signal.connect(
+                    invalidate_recipe_on_commit,
+                    sender=model,
+                    dispatch_uid=f'api_recipe_{action}_{model.__name__}'
+                )
+        m2m_changed.connect(
+            invalidate_recipe_on_commit,
+            sender=Recipe.ingredients.through,
+            dispatch_uid='api_recipe_ingredients'
+        )
+
+        # Deleting a user deletes its token, which covers that case too.
+        post_delete.connect(
+            revoke_token_on_commit,
+            sender=Token,
+            dispatch_uid='api_token_cache_delete_Token'
+        )
+        post_save.connect(
+            revoke_user_tokens_on_commit,
+            sender=CustomUser,
+            dispatch_uid='api_token_cache_save_CustomUser'
+        )
+
+        for model in (Recipe, RecipeIngredient, Ingredient):
+            for action, signal in (
+                ('save', post_save), ('delete', post_delete)
+            ):
+                signal.connect(
+                    pin_to_primary_on_commit,
+                    sender=model,
+                    dispatch_uid=f'api_replica_pin_{action}_{model.__name__}'
+                )
+        m2m_changed.connect(
+            pin_to_primary_on_commit,
+            sender=Recipe.ingredients.through,
+            dispatch_uid='api_replica_pin_recipe_ingredients'
+        )
+        # Deleting a user deletes its recipes, which pins everyone.
+        post_save.connect(
+            pin_to_primary_on_author_change,
+            sender=CustomUser,
+            dispatch_uid='api_replica_pin_save_CustomUser'
+        )
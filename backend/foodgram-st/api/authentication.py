@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import get_generation, invalidate
+
+TOKENS = 'tokens'
+# Never cached: the password hash stays out of the shared cache, and the
+# counters change through update() without revoking cached rows.
+UNCACHED_FIELDS = frozenset(('password', 'recipes_count', 'followers_count'))
+
+
+class TokenCache:
+    """Bounded LRU cache of token keys to user rows with a TTL.
+
+    Holds plain field values by column rather than user objects, so a
+    request that changes its request.user never affects other requests.
+    Entries live in this process, or in the shared Django cache when
+    TOKEN_CACHE_SHARED is set, which makes revocation immediate for every
+    worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    @staticmethod
+    def _shared_key(key):
+        # Keep raw tokens out of the shared cache.
+        return 'auth:token-user:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        if settings.TOKEN_CACHE_SHARED:
+            return cache.get(self._shared_key(key))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return values
+
+    def generation(self):
+        """Changes with every delete; read it before loading a token from
+        the database and pass it to set."""
+        if settings.TOKEN_CACHE_SHARED:
+            return get_generation(TOKENS)
+        return self._generation
+
+    def set(self, key, values, generation):
+        """Store the values unless a token was revoked since the given
+        generation, when they may have been read before the revocation."""
+        if settings.TOKEN_CACHE_SHARED:
+            if get_generation(TOKENS) == generation:
+                cache.set(
+                    self._shared_key(key), values, settings.TOKEN_CACHE_TTL
+                )
+            return
+
+        with self._lock:
+            if self._generation != generation:
+                return
+            self._entries[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_TTL, values
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        if settings.TOKEN_CACHE_SHARED:
+            invalidate(TOKENS)
+            cache.delete_many([self._shared_key(key) for key in keys])
+            return
+
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+token_cache = TokenCache()
+
+
+def _drop_tokens(keys):
+    if keys:
+        token_cache.delete(*keys)
+
+
+def revoke_token_on_commit(instance, **kwargs):
+    """A token was deleted, on logout or with its user."""
+    # The key is the primary key, which delete() clears before commit.
+    keys = [instance.key]
+    transaction.on_commit(lambda: _drop_tokens(keys))
+
+
+def revoke_user_tokens_on_commit(instance, update_fields=None, **kwargs):
+    """The user changed (password, is_active, profile), so cached copies
+    of the row are stale."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(lambda: _drop_tokens(list(
+        Token.objects.filter(user_id=instance.pk).values_list(
+            'key', flat=True
+        )
+    )))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that reads the token and its user from
+    token_cache, so authenticated requests skip the Token-user join.
+
+    Users built from the cache have UNCACHED_FIELDS deferred: they are
+    loaded on first access and left out of a save without update_fields.
+    """
+
+    def authenticate_credentials(self, key):
+        user_model = get_user_model()
+        values = token_cache.get(key)
+        if values is None:
+            generation = token_cache.generation()
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, {
+                field.attname: field.get_prep_value(
+                    getattr(user, field.attname)
+                )
+                for field in user_model._meta.concrete_fields
+                if field.attname not in UNCACHED_FIELDS
+            }, generation)
+            return user, token
+
+        user = user_model.from_db(None, list(values), list(values.values()))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return user, Token(key=key, user=user)
@@ -0,0 +1,214 @@
+import hashlib
+import time
+from functools import partial
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+RECIPES = 'recipes'
+INGREDIENTS = 'ingredients'
+USERS = 'users'
+FAVORITES = 'favorites'
+
+
+def recipe_scope(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_scope(user_id):
+    """Favorites, cart and subscriptions of one user."""
+    return f'user:{user_id}'
+
+
+def _generation_key(scope):
+    return f'api:{scope}:generation'
+
+
+def _initial_generation():
+    # A generation evicted from the cache starts over from the clock
+    # rather than from zero, so it never repeats a value that old pages
+    # or ETags were built from.
+    return time.time_ns()
+
+
+def get_generation(scope):
+    return cache.get_or_set(
+        _generation_key(scope), _initial_generation, timeout=None
+    )
+
+
+def get_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    missing = {
+        key: _initial_generation() for key in keys if key not in generations
+    }
+    for key, generation in missing.items():
+        if not cache.add(key, generation, timeout=None):
+            missing[key] = cache.get(key, generation)
+    generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Drop every cached page of the given scopes.
+
+    Pages are keyed by a generation counter, so bumping it makes all
+    previously cached pages unreachable without scanning the cache.
+    """
+    for scope in scopes:
+        key = _generation_key(scope)
+        if not cache.add(key, _initial_generation(), timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, _initial_generation(), timeout=None)
+
+
+def invalidate_on_commit(scopes, **kwargs):
+    transaction.on_commit(partial(invalidate, *scopes))
+
+
+# Columns of the user row shown with recipes as their author.
+AUTHOR_FIELDS = frozenset(
+    ('username', 'email', 'first_name', 'last_name', 'avatar')
+)
+
+
+def invalidate_on_user_change(scopes, created=False, update_fields=None,
+                              **kwargs):
+    """Users appear in cached pages only as recipe authors, so a new user
+    without recipes or a save of other columns changes nothing there."""
+    if created or update_fields and AUTHOR_FIELDS.isdisjoint(update_fields):
+        return
+    invalidate_on_commit(scopes)
+
+
+def invalidate_recipe_on_commit(instance, reverse=False, pk_set=None,
+                                **kwargs):
+    """Bump the version of the saved recipe, of the recipe owning the
+    saved ingredient row, or of the recipes an ingredient was linked to."""
+    if reverse:
+        recipe_ids = pk_set or ()
+    else:
+        recipe_ids = [getattr(instance, 'recipe_id', instance.pk)]
+    invalidate_on_commit([recipe_scope(pk) for pk in recipe_ids])
+
+
+def _request_fingerprint(request):
+    query = urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+        if value != ''
+    ))
+    return f'{request.get_host()}{request.path}?{query}'
+
+
+def conditional_response(request, scopes, handler, *args, **kwargs):
+    """Answer a GET with an ETag built from the generations of the scopes
+    the response depends on.
+
+    A matching If-None-Match gets 304 before the handler runs, so neither
+    the queryset nor the serializer is touched. The generations are read
+    before the handler, so a change made meanwhile only makes the ETag
+    stale, never the response.
+    """
+    if not settings.API_ETAGS:
+        return handler(request, *args, **kwargs)
+
+    viewer = request.user.pk if request.user.is_authenticated else ''
+    etag = quote_etag(hashlib.md5(':'.join(map(str, [
+        viewer,
+        request.accepted_renderer.format,
+        _request_fingerprint(request),
+        *get_generations(scopes)
+    ])).encode()).hexdigest())
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = handler(request, *args, **kwargs)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        # Clients and proxies revalidate every time, answers for a user
+        # stay out of shared caches.
+        patch_cache_control(response, no_cache=True)
+        if viewer:
+            patch_cache_control(response, private=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """ETags and 304 answers for list and retrieve.
+
+    Responses depend on the scopes returned by get_cache_scopes,
+    cache_scope by default. Set etag_user_state when responses show the
+    favorites, cart or subscriptions of the requesting user.
+    """
+    cache_scope = None
+    etag_user_state = False
+
+    def get_cache_scopes(self, request):
+        scopes = [self.cache_scope]
+        if self.etag_user_state and request.user.is_authenticated:
+            scopes.append(user_scope(request.user.pk))
+        return scopes
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.get_cache_scopes(request), super().list,
+            *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.get_cache_scopes(request), super().retrieve,
+            *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    """Cache list and retrieve responses for anonymous users.
+
+    Keys are built from the generations of get_cache_scopes, the same
+    scopes ETags are built from, and from host, path and normalized query
+    parameters, so any page or filter combination is cached separately.
+    """
+    cache_scope = None
+
+    def get_cache_scopes(self, request):
+        return [self.cache_scope]
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
+
+    def _get_cache_key(self, request):
+        scopes = self.get_cache_scopes(request)
+        digest = hashlib.md5(':'.join(map(str, [
+            _request_fingerprint(request),
+            *scopes,
+            *get_generations(scopes)
+        ])).encode()).hexdigest()
+        return f'api:{self.cache_scope}:{digest}'
+
+    def _cached(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        key = self._get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.db import DatabaseError, connections
+
+POOL_MODES = ('session', 'transaction')
+
+
+@register(Tags.database)
+def check_database_connections(app_configs=None, databases=None, **kwargs):
+    """Connect to every database given to `check --database`."""
+    errors = []
+    for alias in databases or ():
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            errors.append(Error(
+                f'Cannot connect to database "{alias}": {error}',
+                id='api.E003',
+            ))
+    return errors
+
+
+@register()
+def check_database_settings(app_configs=None, **kwargs):
+    errors = []
+    if settings.DB_POOL_MODE not in POOL_MODES:
+        errors.append(Error(
+            f'DB_POOL_MODE is "{settings.DB_POOL_MODE}".',
+            hint=f'Use one of: {", ".join(POOL_MODES)}.',
+            id='api.E001',
+        ))
+
+    for alias, database in settings.DATABASES.items():
+        if (
+            settings.DB_POOL_MODE == 'transaction'
+            and connections[alias].vendor == 'postgresql'
+            and not database.get('DISABLE_SERVER_SIDE_CURSORS')
+        ):
+            errors.append(Error(
+                f'Database "{alias}" uses server-side cursors behind a '
+                'transaction pooler.',
+                hint='Set DISABLE_SERVER_SIDE_CURSORS, iterator() would '
+                     'lose its cursor between transactions.',
+                id='api.E002',
+            ))
+        if settings.SERVER_MODE == 'asgi' and database.get('CONN_MAX_AGE'):
+            errors.append(Warning(
+                f'Database "{alias}" keeps connections open under ASGI.',
+                hint='ASGI requests run in short-lived threads, so '
+                     'connections are not reused. Set DB_CONN_MAX_AGE=0 '
+                     'and use a pooler such as pgbouncer instead.',
+                id='api.W001',
+            ))
+
+    cache_backend = settings.CACHES['default']['BACKEND']
+    if settings.DATABASE_REPLICAS and cache_backend.endswith(
+        '.LocMemCache'
+    ):
+        errors.append(Warning(
+            'DATABASE_REPLICAS are used with a local-memory cache.',
+            hint='Replica pins live in the cache, so a pin set by one '
+                 'worker process is not seen by the others and they may '
+                 'read a lagging replica right after a write. Set '
+                 'REDIS_URL.',
+            id='api.W002',
+        ))
+    return errors
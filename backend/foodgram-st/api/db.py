@@ -0,0 +1,144 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+from recipes.models import DERIVED_RECIPE_FIELDS
+
+from .cache import AUTHOR_FIELDS
+
+# Alias reads of the current request go to, None for the default database.
+_read_alias = ContextVar('read_alias', default=None)
+EVERYONE = 'all'
+
+
+def insert_ignore(model, **values):
+    """Insert one row with INSERT ... ON CONFLICT DO NOTHING.
+
+    Takes column values by attname (user_id=..., recipe_id=...). Returns
+    True when the row was inserted and False when a unique constraint
+    already holds an equal row, so callers need no check before the
+    insert and concurrent duplicates cannot raise IntegrityError.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in values]
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields))
+    )
+    params = [
+        field.get_db_prep_save(value, connection)
+        for field, value in zip(fields, values.values())
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user_id=EVERYONE):
+    """Read from the default database for DB_REPLICA_PIN_SECONDS, for the
+    given user or for everyone, so the write just made is seen."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(
+            _pin_key(user_id), True, settings.DB_REPLICA_PIN_SECONDS
+        )
+
+
+def pin_to_primary_on_commit(update_fields=None, **kwargs):
+    """Pin everyone after a catalog change, which cached pages and ETags
+    would otherwise pick up from a lagging replica.
+
+    Receiver for saves and deletes of recipes, their ingredients and
+    ingredients; background writes of derived recipe columns are skipped.
+    """
+    # A page cached from a lagging replica may miss the latest derived
+    # values until the next change, which costs clients no more than the
+    # full-size image or an older count.
+    if update_fields and DERIVED_RECIPE_FIELDS.issuperset(update_fields):
+        return
+    transaction.on_commit(pin_to_primary)
+
+
+def pin_to_primary_on_author_change(instance, created=False,
+                                    update_fields=None, **kwargs):
+    """Pin everyone when a recipe author changes what recipe pages show
+    of them; registrations and other profile changes pin no one but the
+    user, through ReplicaReadMixin."""
+    if created or update_fields and AUTHOR_FIELDS.isdisjoint(update_fields):
+        return
+    # The counter of a loaded user may be behind, the recipes are not.
+    if instance.recipes.exists():
+        transaction.on_commit(pin_to_primary)
+
+
+def is_pinned_to_primary(user):
+    keys = [_pin_key(EVERYONE)]
+    if user.is_authenticated:
+        keys.append(_pin_key(user.pk))
+    return bool(cache.get_many(keys))
+
+
+class ReplicaRouter:
+    """Reads go to the replica chosen by ReplicaReadMixin for the current
+    request, everything else to the default database."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from a random replica of DATABASE_REPLICAS.
+
+    Authentication and permission checks still read the default database,
+    so a token created a moment ago is found. A successful unsafe request
+    pins the user to the default database for DB_REPLICA_PIN_SECONDS, so
+    for example a recipe favorited a moment ago is shown as favorited.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and not is_pinned_to_primary(request.user)
+        ):
+            _read_alias.set(random.choice(settings.DATABASE_REPLICAS))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,309 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+)
+from rest_framework.test import APIClient
+
+from ingredients.models import Ingredient
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.feed import rebuild_feeds
+from recipes.search import update_search_vectors
+from recipes.shopping_list import rebuild_shopping_lists
+from users.models import CustomUser, Subscribe
+
+# Route name -> (path, authenticated, max queries).
+ROUTES = {
+    "recipes-list-anon": ("/api/recipes/?limit={limit}", False, 4),
+    "recipes-list": ("/api/recipes/?limit={limit}", True, 4),
+    "recipes-cursor": ("/api/recipes/?cursor=&limit={limit}", True, 3),
+    "recipes-favorited": (
+        "/api/recipes/?is_favorited=1&limit={limit}", True, 4
+    ),
+    "recipes-in-cart": (
+        "/api/recipes/?is_in_shopping_cart=1&limit={limit}", True, 4
+    ),
+    "recipes-detail": ("/api/recipes/{recipe_id}/", True, 3),
+    "recipes-cookable": (
+        "/api/recipes/cookable/?{ingredient_ids}&limit={limit}", True, 3
+    ),
+    "recipes-search": (
+        "/api/recipes/?search={ingredient}&limit={limit}", True, 4
+    ),
+    "subscriptions": (
+        "/api/users/subscriptions/?limit={limit}&recipes_limit=3", True, 3
+    ),
+    "subscriptions-cursor": (
+        "/api/users/subscriptions/?cursor=&limit={limit}&recipes_limit=3",
+        True,
+        2,
+    ),
+    "download-shopping-cart": (
+        "/api/recipes/download_shopping_cart/", True, 2
+    ),
+    "shopping-list": ("/api/recipes/shopping_list/", True, 1),
+    "feed": ("/api/users/feed/?limit={limit}", True, 4),
+    "ingredients-search": ("/api/ingredients/?name={ingredient}", False, 0),
+    "users-list": ("/api/users/?limit={limit}", False, 2),
+}
+# Routes whose budgets mean nothing when they match no rows.
+NON_EMPTY_ROUTES = ("recipes-search", "ingredients-search")
+PAGE_SIZES = (5, 20)
+# Response caching would hide regressions in the views themselves.
+NO_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+}
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset in a throwaway test database and check "
+        "SQL query count and wall time of every API route"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=5000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument(
+            "--ingredients-per-recipe", type=int, default=8
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--max-p95-ms",
+            type=float,
+            help=(
+                "Fail when p95 wall time of a route exceeds this value; "
+                "by default latency is only reported"
+            ),
+        )
+        parser.add_argument(
+            "--route",
+            action="append",
+            choices=sorted(ROUTES),
+            help="Benchmark only the given route (can be repeated)",
+        )
+        parser.add_argument(
+            "--close-connections",
+            action="store_true",
+            help=(
+                "Close the database connection after every request, as "
+                "DB_CONN_MAX_AGE=0 does, to measure the cost of "
+                "reconnecting (not measurable on in-memory SQLite)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            # Replicas are not part of the throwaway database.
+            with override_settings(CACHES=NO_CACHE, DATABASE_REPLICAS=[]):
+                failures = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError(
+                "Benchmark budgets exceeded:\n" + "\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("All routes within budget"))
+
+    def _run(self, options):
+        started = time.perf_counter()
+        user, recipe_id, ingredient = self._seed(options)
+        ingredient_ids = "&".join(
+            f"ingredients={pk}"
+            for pk in Ingredient.objects.values_list("pk", flat=True)[:10]
+        )
+        self.stdout.write(
+            f"Seeded dataset in {time.perf_counter() - started:.1f}s"
+        )
+
+        anonymous = APIClient()
+        authenticated = APIClient()
+        authenticated.force_authenticate(user)
+
+        failures = []
+        for name in options["route"] or ROUTES:
+            path, is_authenticated, max_queries = ROUTES[name]
+            client = authenticated if is_authenticated else anonymous
+            query_counts = []
+            timings = []
+
+            for limit in PAGE_SIZES:
+                url = path.format(
+                    limit=limit,
+                    recipe_id=recipe_id,
+                    ingredient=ingredient,
+                    ingredient_ids=ingredient_ids,
+                )
+                for _ in range(options["iterations"]):
+                    with CaptureQueriesContext(connection) as queries:
+                        request_started = time.perf_counter()
+                        response = client.get(url)
+                        if getattr(response, "streaming", False):
+                            b"".join(response.streaming_content)
+                        timings.append(
+                            (time.perf_counter() - request_started) * 1000
+                        )
+                        if options["close_connections"]:
+                            connection.close()
+                    if response.status_code != 200:
+                        failures.append(
+                            f"{name}: {url} returned {response.status_code}"
+                        )
+                        break
+                    if name in NON_EMPTY_ROUTES and self._is_empty(response):
+                        failures.append(f"{name}: {url} returned no results")
+                        break
+                query_counts.append(len(queries))
+
+            p50, p95 = self._percentiles(timings)
+            self.stdout.write(
+                f"{name:<24} queries={'/'.join(map(str, query_counts)):<7} "
+                f"p50={p50:7.2f}ms p95={p95:7.2f}ms"
+            )
+            if max(query_counts) > max_queries:
+                failures.append(
+                    f"{name}: {max(query_counts)} queries, "
+                    f"budget is {max_queries}"
+                )
+            if len(set(query_counts)) > 1:
+                failures.append(
+                    f"{name}: query count grows with page size "
+                    f"({query_counts}), probable N+1"
+                )
+            if options["max_p95_ms"] is not None and (
+                p95 > options["max_p95_ms"]
+            ):
+                failures.append(
+                    f"{name}: p95 {p95:.2f}ms, "
+                    f"budget is {options['max_p95_ms']}ms"
+                )
+        return failures
+
+    @staticmethod
+    def _is_empty(response):
+        data = response.json()
+        if isinstance(data, dict):
+            data = data.get("results")
+        return not data
+
+    @staticmethod
+    def _percentiles(timings):
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cut_points = statistics.quantiles(timings, n=100)
+        return statistics.median(timings), cut_points[94]
+
+    def _seed(self, options):
+        rng = random.Random(0)
+        password = make_password("benchmark-password")
+
+        CustomUser.objects.bulk_create(
+            [
+                CustomUser(
+                    username=f"user{index}",
+                    email=f"user{index}@example.com",
+                    first_name="Имя",
+                    last_name="Фамилия",
+                    password=password,
+                )
+                for index in range(options["users"])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(
+                    name=f"ингредиент {index}", measurement_unit="г"
+                )
+                for index in range(options["ingredients"])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(CustomUser.objects.values_list("id", flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    name=f"Рецепт {index}",
+                    text="Описание рецепта",
+                    cooking_time=rng.randint(
+                        Recipe.MIN_COOKING_TIME, 180
+                    ),
+                    author_id=rng.choice(user_ids),
+                    image="images/recipes/benchmark.png",
+                )
+                for index in range(options["recipes"])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+
+        per_recipe = min(
+            options["ingredients_per_recipe"], len(ingredient_ids)
+        )
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(RecipeIngredient.MIN_AMOUNT, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        update_search_vectors()
+
+        relations = []
+        for user_id in user_ids:
+            relations.extend(
+                (user_id, recipe_id)
+                for recipe_id in rng.sample(
+                    recipe_ids, min(10, len(recipe_ids))
+                )
+            )
+        Favorite.objects.bulk_create(
+            [Favorite(user_id=u, recipe_id=r) for u, r in relations],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user_id=u, recipe_id=r) for u, r in relations],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        rebuild_shopping_lists()
+        Subscribe.objects.bulk_create(
+            [
+                Subscribe(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in rng.sample(user_ids, min(30, len(user_ids)))
+                if author_id != user_id
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        rebuild_feeds()
+
+        user = CustomUser.objects.get(id=user_ids[0])
+        # An ingredient of a seeded recipe, so searching by it matches.
+        ingredient = Ingredient.objects.filter(
+            ingredient_recipe__recipe_id=recipe_ids[0]
+        ).order_by("id").first().name
+        return user, recipe_ids[0], ingredient
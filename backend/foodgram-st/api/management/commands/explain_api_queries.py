@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.shopping_list import get_shopping_list_queryset
+from api.views import RecipeViewSet, UserViewSet
+from ingredients.models import Ingredient
+from recipes.models import Favorite, RecipeIngredient, ShoppingCart
+from users.models import CustomUser, Subscribe
+
+
+class Command(BaseCommand):
+    help = (
+        "Print EXPLAIN plans of the main API queries, e.g. before and "
+        "after applying index migrations"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=str,
+            help="Email of the user to build queries for",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run the queries and show actual timings (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--search",
+            type=str,
+            default="сыр",
+            help="Text used in name search queries",
+        )
+
+    def handle(self, *args, **options):
+        user = self._get_user(options["user"])
+        request = Request(
+            APIRequestFactory().get("/", {"recipes_limit": 3})
+        )
+        request.user = user
+
+        recipe_view = RecipeViewSet(request=request, format_kwarg=None)
+        user_view = UserViewSet(request=request, format_kwarg=None)
+        recipes = recipe_view.get_queryset()
+        recipe_ids = list(recipes.values_list("id", flat=True)[:10])
+        recipe_id = recipe_ids[0] if recipe_ids else 0
+
+        queries = {
+            "recipes list": recipes[:10],
+            "recipes is_favorited=1": recipes.filter(is_favorited=True)[:10],
+            "recipes is_in_shopping_cart=1": recipes.filter(
+                is_in_shopping_cart=True
+            )[:10],
+            "recipe ingredients prefetch": RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).select_related("ingredient"),
+            "favorite lookup by recipe": Favorite.objects.filter(
+                recipe_id=recipe_id, user=user
+            ),
+            "shopping cart lookup by recipe": ShoppingCart.objects.filter(
+                recipe_id=recipe_id, user=user
+            ),
+            "followers of author": Subscribe.objects.filter(author=user),
+            "subscriptions": user_view.get_subscriptions_queryset()[:10],
+            "download shopping cart": get_shopping_list_queryset(user),
+            "ingredient name search": Ingredient.objects.filter(
+                name__icontains=options["search"]
+            ),
+            "recipe name search": recipes.filter(
+                name__icontains=options["search"]
+            )[:10],
+        }
+
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        for title, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
+
+    def _get_user(self, email):
+        if email:
+            user = CustomUser.objects.filter(email=email).first()
+        else:
+            user = (
+                CustomUser.objects.filter(shopping_cart__isnull=False).first()
+                or CustomUser.objects.first()
+            )
+        if user is None:
+            raise CommandError("No user to build queries for")
+        return user
@@ -0,0 +1,106 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+# Route name -> (path, authenticated).
+ROUTES = {
+    "recipes-list": ("/api/recipes/?limit=10", False),
+    "recipes-detail": ("/api/recipes/{recipe_id}/", False),
+    "ingredients-search": ("/api/ingredients/?name={ingredient}", False),
+    "download-shopping-cart": (
+        "/api/recipes/download_shopping_cart/?format=pdf", True
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with concurrent requests and report "
+        "throughput and latency per route, to compare WSGI and ASGI mode"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=20.0,
+            help="Seconds of load per route",
+        )
+        parser.add_argument(
+            "--token",
+            help="Auth token for routes that need a user with a cart",
+        )
+        parser.add_argument("--recipe-id", type=int, default=1)
+        parser.add_argument("--ingredient", default="мо")
+        parser.add_argument(
+            "--route",
+            action="append",
+            choices=sorted(ROUTES),
+            help="Load only the given route (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        routes = options["route"] or [
+            name for name, (_, is_authenticated) in ROUTES.items()
+            if options["token"] or not is_authenticated
+        ]
+        for name in routes:
+            path, is_authenticated = ROUTES[name]
+            if is_authenticated and not options["token"]:
+                raise CommandError(f"{name} needs --token")
+            url = options["url"].rstrip("/") + path.format(
+                recipe_id=options["recipe_id"],
+                ingredient=options["ingredient"],
+            )
+            headers = (
+                {"Authorization": f"Token {options['token']}"}
+                if is_authenticated else {}
+            )
+            timings, errors, elapsed = self._load(url, headers, options)
+            if not timings:
+                raise CommandError(f"{name}: every request failed")
+
+            cut_points = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f"{name:<24} requests={len(timings):<6} errors={errors:<4} "
+                f"rps={len(timings) / elapsed:8.1f} "
+                f"p50={statistics.median(timings):7.2f}ms "
+                f"p95={cut_points[94]:7.2f}ms p99={cut_points[98]:7.2f}ms"
+            )
+
+    @staticmethod
+    def _load(url, headers, options):
+        deadline = time.monotonic() + options["duration"]
+        lock = threading.Lock()
+        timings = []
+        errors = 0
+
+        def worker():
+            nonlocal errors
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = session.get(url, headers=headers, timeout=30)
+                    response.content
+                    failed = response.status_code != 200
+                except requests.RequestException:
+                    failed = True
+                duration = (time.perf_counter() - started) * 1000
+                with lock:
+                    if failed:
+                        errors += 1
+                    else:
+                        timings.append(duration)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            for _ in range(options["concurrency"]):
+                executor.submit(worker)
+        return timings, errors, time.monotonic() - started
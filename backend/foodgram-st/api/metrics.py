@@ -0,0 +1,91 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+SECONDS_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (
+    100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000
+)
+
+REQUEST_SECONDS = Histogram(
+    'foodgram_request_duration_seconds',
+    'Time from the view call to the last byte of the response body.',
+    ['view'],
+    buckets=SECONDS_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries',
+    'SQL queries executed per request.',
+    ['view'],
+    buckets=QUERY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    'foodgram_db_duration_seconds',
+    'Time spent in SQL queries per request.',
+    ['view'],
+    buckets=SECONDS_BUCKETS
+)
+SERIALIZER_SECONDS = Histogram(
+    'foodgram_serializer_duration_seconds',
+    'Time spent in serializers building response data per request, SQL '
+    'queries they run excluded.',
+    ['view'],
+    buckets=SECONDS_BUCKETS
+)
+APP_SECONDS = Histogram(
+    'foodgram_app_duration_seconds',
+    'Time spent outside SQL queries per request: view code, '
+    'serialization and rendering.',
+    ['view'],
+    buckets=SECONDS_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    'foodgram_response_size_bytes',
+    'Size of non-streaming response bodies.',
+    ['view'],
+    buckets=BYTES_BUCKETS
+)
+
+
+def _get_registry():
+    """Series of every worker process when PROMETHEUS_MULTIPROC_DIR is
+    set (gunicorn.conf.py does), of this process otherwise."""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def _is_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(
+        authorization.encode(), f'Bearer {token}'.encode()
+    )
+
+
+def metrics_view(request):
+    # Internal endpoint: unknown clients see no difference from a
+    # missing page.
+    if not _is_allowed(request):
+        raise Http404
+    return HttpResponse(
+        generate_latest(_get_registry()),
+        content_type=CONTENT_TYPE_LATEST
+    )
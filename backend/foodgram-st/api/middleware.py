@@ -0,0 +1,179 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async
+)
+from django.conf import settings
+from django.db import connections
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+# QueryRecorder of the request being handled, for measure_serialization.
+_recorder = ContextVar('metrics_recorder', default=None)
+
+
+def get_view_name(view_func, method):
+    """Name a view as `RecipeViewSet.list` for DRF viewsets, by its
+    metrics_name for function views standing in for a viewset action, and
+    by its class or function name otherwise."""
+    metrics_name = getattr(view_func, 'metrics_name', None)
+    if metrics_name is not None:
+        return metrics_name
+
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryRecorder:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serializer_duration = 0.0
+        self.is_serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+@contextmanager
+def measure_serialization():
+    """Add the time of the block, minus the SQL queries it runs, to the
+    serializer time of the current request. Nested blocks are counted
+    once, by the outermost one."""
+    recorder = _recorder.get()
+    if recorder is None or recorder.is_serializing:
+        yield
+        return
+
+    recorder.is_serializing = True
+    started = time.perf_counter()
+    db_duration = recorder.duration
+    try:
+        yield
+    finally:
+        recorder.is_serializing = False
+        recorder.serializer_duration += (
+            time.perf_counter() - started
+            - (recorder.duration - db_duration)
+        )
+
+
+class InstrumentationMiddleware:
+    """Record query count, database time, serializer time, time outside
+    the database and response size per view, and warn when a request
+    exceeds REQUEST_QUERY_BUDGET.
+
+    Under WSGI, streaming responses are observed once their body is
+    consumed, so queries run while the body is generated are counted.
+
+    Works in both WSGI and ASGI mode, so async views keep running in the
+    event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        try:
+            with ExitStack() as stack:
+                self._record_queries(stack, recorder)
+                response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        if response.streaming and hasattr(request, '_metrics_view'):
+            response.streaming_content = self._stream(
+                request, response, response.streaming_content, recorder
+            )
+            return response
+        return self._observe(request, response, recorder)
+
+    async def _acall(self, request):
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        stack = ExitStack()
+        # Sync code of an ASGI request, ORM calls of async views included,
+        # runs in one thread with its own connections, so the wrappers are
+        # installed there.
+        await sync_to_async(self._record_queries)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _recorder.reset(token)
+        return self._observe(request, response, recorder)
+
+    @staticmethod
+    def _record_queries(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def _stream(self, request, response, content, recorder):
+        try:
+            with ExitStack() as stack:
+                self._record_queries(stack, recorder)
+                yield from content
+        finally:
+            self._observe(request, response, recorder)
+
+    def _observe(self, request, response, recorder):
+        view_name = getattr(request, '_metrics_view', None)
+        if view_name is None:
+            return response
+
+        duration = time.perf_counter() - request._metrics_started
+        metrics.REQUEST_SECONDS.labels(view_name).observe(duration)
+        metrics.DB_QUERIES.labels(view_name).observe(recorder.count)
+        metrics.DB_SECONDS.labels(view_name).observe(recorder.duration)
+        metrics.SERIALIZER_SECONDS.labels(view_name).observe(
+            max(recorder.serializer_duration, 0)
+        )
+        metrics.APP_SECONDS.labels(view_name).observe(
+            max(duration - recorder.duration, 0)
+        )
+        if not response.streaming:
+            metrics.RESPONSE_BYTES.labels(view_name).observe(
+                len(response.content)
+            )
+
+        if recorder.count > settings.REQUEST_QUERY_BUDGET:
+            logger.warning(
+                '%s %s (%s) ran %d SQL queries, budget is %d',
+                request.method,
+                request.path,
+                view_name,
+                recorder.count,
+                settings.REQUEST_QUERY_BUDGET
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = get_view_name(view_func, request.method)
+        request._metrics_started = time.perf_counter()
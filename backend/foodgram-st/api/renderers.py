@@ -0,0 +1,53 @@
+from rest_framework import exceptions, renderers
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class PassthroughRenderer(renderers.BaseRenderer):
+    """Renderer for views that build the response body themselves.
+
+    Error responses raised before the view runs still carry serializer
+    data, so those are rendered as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, (bytes, str)):
+            return data
+        return renderers.JSONRenderer().render(data)
+
+
+class PlainTextRenderer(PassthroughRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(PassthroughRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(PassthroughRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class FallbackContentNegotiation(DefaultContentNegotiation):
+    """Picks the first renderer when the Accept header matches none of
+    them, so clients sending Accept: application/json still get the file.
+
+    A ?format= still picks the renderer, and an unknown one is answered
+    with 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except exceptions.NotAcceptable:
+            format_query_param = self.settings.URL_FORMAT_OVERRIDE
+            format = format_suffix or request.query_params.get(
+                format_query_param
+            )
+            if format:
+                renderers = self.filter_renderers(renderers, format)
+            return renderers[0], renderers[0].media_type
@@ -1,32 +1,106 @@
 
 from rest_framework import serializers
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework.exceptions import ValidationError
+from functools import partial
 import base64
+import binascii
+import re
 
 from users.models import (
     CustomUser
 )
+from recipes import feed, shopping_list
 from recipes.models import (
     Ingredient,
     RecipeIngredient,
-    Recipe
+    Recipe,
+    ShoppingListItem
 )
+from recipes.images import schedule_thumbnails
+from recipes.search import update_search_vectors
+from api.middleware import measure_serialization
 
+AVATAR_HEADER = re.compile(r'^data:image/(png|jpe?g|gif|webp)$')
 
-class IngredientSerializer(serializers.ModelSerializer):
+
+class MeasuredSerializerMixin:
+    """Counts to_representation towards the serializer time of the
+    request in the /metrics/ histograms."""
+
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+class ThumbnailsField(serializers.Field):
+    """Urls of the recipe image thumbnails rendered by image workers."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'image_thumbnails')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        thumbnails = {}
+        for size_name, formats in (value or {}).items():
+            thumbnails[size_name] = {}
+            for format_name, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                thumbnails[size_name][format_name] = url
+        return thumbnails
+
+
+class IngredientSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
 
     class Meta:
         model = Ingredient
         fields = ['id', 'measurement_unit', 'name']
 
 
-class IngredientRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
+class IngredientRecipeListSerializer(serializers.ListSerializer):
+    """Resolves the ingredients of all items with one in_bulk query
+    instead of a query per item."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            {item['ingredient'] for item in items}
+        )
+
+        errors = []
+        for item in items:
+            ingredient = ingredients.get(item['ingredient'])
+            if ingredient is None:
+                errors.append({'id': [
+                    serializers.PrimaryKeyRelatedField.default_error_messages[
+                        'does_not_exist'
+                    ].format(pk_value=item['ingredient'])
+                ]})
+            else:
+                errors.append({})
+            item['ingredient'] = ingredient
+
+        if any(errors):
+            raise ValidationError(errors)
+        return items
+
+
+class IngredientRecipeSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
+    id = serializers.IntegerField(source='ingredient')
     name = serializers.CharField(source='ingredient.name', read_only=True)
     amount = serializers.IntegerField(
         min_value=RecipeIngredient.MIN_AMOUNT,
@@ -41,20 +115,22 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ['id', 'recipe', 'amount', 'name']
         read_only_fields = ['id', 'recipe']
+        list_serializer_class = IngredientRecipeListSerializer
 
     def to_representation(self, instance):
-
-        representation = super().to_representation(instance)
         current_ingredient = instance.ingredient
         return {
             'id': current_ingredient.id,
             'measurement_unit': current_ingredient.measurement_unit,
             'name': current_ingredient.name,
-            'amount': representation['amount'],
+            'amount': instance.amount,
         }
 
 
-class CustomUserWriteSerializer(serializers.ModelSerializer):
+class CustomUserWriteSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -72,7 +148,10 @@ class CustomUserWriteSerializer(serializers.ModelSerializer):
         return user
 
 
-class CustomUserReadSerializer(serializers.ModelSerializer):
+class CustomUserReadSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     avatar = Base64ImageField(required=False, allow_null=True)
 
@@ -85,6 +164,9 @@ class CustomUserReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+
         current_user = self.context['request'].user
 
         if current_user.is_authenticated:
@@ -92,9 +174,13 @@ class CustomUserReadSerializer(serializers.ModelSerializer):
         return False
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
     author = CustomUserReadSerializer(read_only=True)
     image = Base64ImageField(required=True)
+    thumbnails = ThumbnailsField()
     id = serializers.PrimaryKeyRelatedField(read_only=True)
     cooking_time = serializers.IntegerField(
         min_value=Recipe.MIN_COOKING_TIME,
@@ -118,8 +204,9 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'image', 'ingredients', 'is_favorited',
-            'text', 'cooking_time', 'author', 'is_in_shopping_cart'
+            'id', 'name', 'image', 'thumbnails', 'ingredients',
+            'is_favorited', 'text', 'cooking_time', 'author',
+            'is_in_shopping_cart'
         )
         read_only_fields = (
             'is_in_shopping_cart', 'is_favorited', 'author'
@@ -136,22 +223,33 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise ValidationError('Ингредиенты отсутствуют.')
 
-        ingredient_ids = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient["ingredient"].id
-            if ingredient_id in ingredient_ids:
-                raise ValidationError("Ингредиенты должны быть уникальными.")
-            ingredient_ids.append(ingredient_id)
+        ingredient_ids = {
+            ingredient["ingredient"].id for ingredient in ingredients
+        }
+        if len(ingredient_ids) != len(ingredients):
+            raise ValidationError("Ингредиенты должны быть уникальными.")
 
         return ingredients
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        # No-op for querysets that already prefetch it, saves a query per
+        # ingredient when rendering a recipe that was just written.
+        prefetch_related_objects([instance], 'ingredient_recipe__ingredient')
+        return super().to_representation(instance)
+
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+
         current_user = self.context['request'].user
 
         if current_user.is_authenticated:
             return obj.shopping_cart.filter(user=current_user).exists()
         return False
 
+    @transaction.atomic
     def create(self, validated_data):
         current_ingredients_data = validated_data.pop('ingredient_recipe')
 
@@ -159,27 +257,36 @@ class RecipeSerializer(serializers.ModelSerializer):
         current_recipe.save()
 
         self._create_ingredients(current_recipe, current_ingredients_data)
+        update_search_vectors(Recipe.objects.filter(pk=current_recipe.pk))
+        feed.fan_out(current_recipe)
+        transaction.on_commit(
+            partial(schedule_thumbnails, current_recipe.pk)
+        )
         return current_recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         current_ingredients_data = validated_data.pop(
             'ingredient_recipe',
             None
         )
 
-        instance = super().update(instance, validated_data)
-        instance.save()
-
         if current_ingredients_data is None:
             raise ValidationError(
                 'ingredients обязательно для обновления рецепта.'
             )
-        
-        instance.ingredients.clear()
-        self._create_ingredients(instance, current_ingredients_data)
+
+        instance = super().update(instance, validated_data)
+        self._update_ingredients(instance, current_ingredients_data)
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+        if 'image' in validated_data:
+            transaction.on_commit(partial(schedule_thumbnails, instance.pk))
         return instance
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+
         current_user = self.context['request'].user
 
         if current_user.is_authenticated:
@@ -195,12 +302,100 @@ class RecipeSerializer(serializers.ModelSerializer):
             ) for ingredient_data in ingredients_data
         ])
 
-class SmallRecipeSerializer(serializers.ModelSerializer):
+    def _update_ingredients(self, recipe, ingredients_data):
+        """Write only the difference between the incoming ingredients and
+        the stored rows, keeping the rows of unchanged ingredients."""
+        existing = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        incoming = {
+            ingredient_data['ingredient'].id: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+
+        to_delete = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in incoming
+        ]
+        deltas = {}
+        to_update = []
+        to_create = []
+        for ingredient_id, amount in incoming.items():
+            row = existing.get(ingredient_id)
+            if row is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                ))
+                deltas[ingredient_id] = amount
+            elif row.amount != amount:
+                deltas[ingredient_id] = amount - row.amount
+                row.amount = amount
+                to_update.append(row)
+
+        # Deleted rows reach the shopping lists through post_delete, bulk
+        # writes send no signals and pass their deltas explicitly.
+        with shopping_list.batch():
+            if to_delete:
+                RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+            if to_create:
+                RecipeIngredient.objects.bulk_create(to_create)
+            shopping_list.change_recipe(recipe.pk, deltas)
+
+
+class SmallRecipeSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
     image = Base64ImageField(allow_null=True)
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image', 'name', 'cooking_time')
+        fields = ('id', 'image', 'thumbnails', 'name', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    MAX_RECIPES = 100
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    MAX_INGREDIENTS = 200
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_INGREDIENTS
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class ShoppingListItemSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
 class CustomUserAvatarSerializer(serializers.ModelSerializer):
@@ -218,9 +413,15 @@ class CustomUserAvatarSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Некорректный аватар.')
 
         header, data = avatar_data.split(';base64,', 1)
-        file_extension = header.split('/')[-1]
+        header_match = AVATAR_HEADER.match(header)
+        if header_match is None:
+            raise serializers.ValidationError('Некорректный аватар.')
+        file_extension = header_match.group(1)
 
-        file = base64.b64decode(data)
+        try:
+            file = base64.b64decode(data, validate=True)
+        except binascii.Error:
+            raise serializers.ValidationError('Некорректный аватар.')
 
         return ContentFile(
             content=file,
@@ -234,15 +435,18 @@ class CustomUserAvatarSerializer(serializers.ModelSerializer):
             )
 
         instance.avatar = validated_data['avatar']
-        instance.save()
+        instance.save(update_fields=['avatar'])
         return instance
 
 
-class SubscritionSerializer(serializers.ModelSerializer):
+class SubscritionSerializer(
+    MeasuredSerializerMixin,
+    serializers.ModelSerializer
+):
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     avatar = Base64ImageField(required=False, allow_null=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = CustomUser
@@ -253,6 +457,9 @@ class SubscritionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+
         current_user = self.context['request'].user
 
         if current_user.is_authenticated:
@@ -260,6 +467,11 @@ class SubscritionSerializer(serializers.ModelSerializer):
         return False
 
     def get_recipes(self, instance):
+        if hasattr(instance, 'limited_recipes'):
+            return SmallRecipeSerializer(
+                instance.limited_recipes, many=True
+            ).data
+
         request = self.context.get('request')
         limit = request.query_params.get('recipes_limit')
 
@@ -275,6 +487,3 @@ class SubscritionSerializer(serializers.ModelSerializer):
 
         serialized_recipes = SmallRecipeSerializer(recipes_queryset, many=True)
         return serialized_recipes.data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,109 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+ITERATOR_CHUNK_SIZE = 2000
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FALLBACK_FONT = 'Helvetica'
+
+
+def get_shopping_list_queryset(user):
+    """Ingredients of every recipe in the user's cart, summed per ingredient.
+
+    Reads the materialized list maintained by recipes.shopping_list.
+    """
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient_id',
+        name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit'),
+        total_amount=F('amount')
+    ).order_by('name', 'ingredient_id')
+
+
+def get_shopping_list(user):
+    """Rows of the shopping list read through a server-side cursor, so the
+    list is never held in memory as a whole."""
+    return get_shopping_list_queryset(user).iterator(
+        chunk_size=ITERATOR_CHUNK_SIZE
+    )
+
+
+def stream_txt(rows):
+    for item in rows:
+        yield f"{item['name']}: {item['total_amount']} {item['unit']}\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['Ингредиент', 'Количество', 'Единица измерения'])
+    for item in rows:
+        yield writer.writerow(
+            [item['name'], item['total_amount'], item['unit']]
+        )
+
+
+def _get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+
+    font_path = getattr(settings, 'SHOPPING_LIST_PDF_FONT', '')
+    if not font_path or not os.path.exists(font_path):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def stream_pdf(rows):
+    """Unlike txt and csv, the PDF is not streamed: reportlab writes the
+    document only on save, so it is built whole in memory first and then
+    handed out in chunks."""
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    font = _get_pdf_font()
+    width, height = A4
+    margin = 50
+    line_height = 18
+
+    def start_page():
+        document.setFont(font, 14)
+        document.drawString(margin, height - margin, 'Список покупок')
+        document.setFont(font, 11)
+        return height - margin - 2 * line_height
+
+    y = start_page()
+    for item in rows:
+        if y < margin:
+            document.showPage()
+            y = start_page()
+        document.drawString(
+            margin, y,
+            f"{item['name']}: {item['total_amount']} {item['unit']}"
+        )
+        y -= line_height
+    document.save()
+
+    buffer.seek(0)
+    while chunk := buffer.read(PDF_CHUNK_SIZE):
+        yield chunk
+
+
+SHOPPING_LIST_STREAMS = {
+    'txt': stream_txt,
+    'csv': stream_csv,
+    'pdf': stream_pdf,
+}
@@ -0,0 +1,329 @@
+import json
+from base64 import b64encode
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import TokenCache, token_cache
+from ingredients.models import Ingredient
+from recipes.models import Recipe, RecipeIngredient
+from users.models import CustomUser, Subscribe
+
+
+def create_user(index):
+    return CustomUser.objects.create(
+        username=f'user{index}',
+        email=f'user{index}@example.com',
+        first_name='Имя',
+        last_name='Фамилия'
+    )
+
+
+def encode_position(values):
+    """A cursor as KeysetPaginator builds it, for a forged position."""
+    return b64encode(
+        urlencode({'p': json.dumps(values)}).encode()
+    ).decode()
+
+
+def create_recipe(author, index):
+    return Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {index}',
+        text='Описание',
+        cooking_time=10,
+        image='images/recipes/test.png'
+    )
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.authors = [create_user(index) for index in range(1, 8)]
+        cls.recipes = [
+            create_recipe(cls.authors[index % 7], index)
+            for index in range(25)
+        ]
+        # Equal publication times, so only the id tells rows apart.
+        Recipe.objects.update(created=timezone.now())
+        for author in cls.authors:
+            Subscribe.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        """Follow next links from the url, then previous links back."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            previous, url = response.data['previous'], response.data['next']
+        backwards = []
+        while previous:
+            response = self.client.get(previous)
+            self.assertEqual(response.status_code, 200)
+            backwards.insert(
+                0, [item['id'] for item in response.data['results']]
+            )
+            previous = response.data['previous']
+        return pages, backwards
+
+    def test_recipes_with_equal_created_are_neither_repeated_nor_skipped(self):
+        pages, backwards = self.walk('/api/recipes/?cursor=&limit=4')
+
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(
+            ids, sorted((recipe.pk for recipe in self.recipes), reverse=True)
+        )
+        self.assertEqual(len(pages), 7)
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_ordering_by_favorites_count_breaks_ties_by_id(self):
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in self.recipes[::3]
+        ]).update(favorites_count=5)
+
+        pages, _ = self.walk(
+            '/api/recipes/?cursor=&limit=5&ordering=-favorites_count'
+        )
+
+        expected = Recipe.objects.order_by(
+            '-favorites_count', '-id'
+        ).values_list('pk', flat=True)
+        self.assertEqual([pk for page in pages for pk in page], list(expected))
+
+    def test_users_list_accepts_cursor(self):
+        # djoser lists only themselves to users other than staff.
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+
+        pages, backwards = self.walk('/api/users/?cursor=&limit=3')
+
+        self.assertEqual(
+            [pk for page in pages for pk in page],
+            list(CustomUser.objects.order_by('id').values_list(
+                'pk', flat=True
+            ))
+        )
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_subscriptions_accept_cursor(self):
+        pages, _ = self.walk(
+            '/api/users/subscriptions/?cursor=&limit=2&recipes_limit=1'
+        )
+
+        self.assertEqual(
+            [pk for page in pages for pk in page],
+            [author.pk for author in self.authors]
+        )
+
+    def test_malformed_cursor_is_not_found(self):
+        for cursor in (
+            'garbage',
+            encode_position(['1']),
+            encode_position(['not a date', '1']),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeIngredientsUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(0)
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.recipe = create_recipe(self.author, 0)
+        self.rows = {
+            ingredient.pk: RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=ingredient, amount=10
+            )
+            for ingredient in self.ingredients[:3]
+        }
+
+    def patch(self, ingredients):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in ingredients
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def stored(self):
+        return {
+            row.ingredient_id: (row.pk, row.amount)
+            for row in RecipeIngredient.objects.filter(recipe=self.recipe)
+        }
+
+    def test_unchanged_rows_are_kept(self):
+        first, second, third, fourth = self.ingredients
+
+        response = self.patch([(first, 10), (second, 25), (fourth, 5)])
+
+        stored = self.stored()
+        self.assertEqual(set(stored), {first.pk, second.pk, fourth.pk})
+        self.assertEqual(stored[first.pk], (self.rows[first.pk].pk, 10))
+        self.assertEqual(stored[second.pk], (self.rows[second.pk].pk, 25))
+        self.assertEqual(stored[fourth.pk][1], 5)
+        self.assertFalse(
+            RecipeIngredient.objects.filter(pk=self.rows[third.pk].pk).exists()
+        )
+        self.assertEqual(
+            {
+                (item['id'], item['amount'])
+                for item in response.data['ingredients']
+            },
+            {(first.pk, 10), (second.pk, 25), (fourth.pk, 5)}
+        )
+
+    def test_same_ingredients_write_nothing(self):
+        before = self.stored()
+
+        self.patch([(ingredient, 10) for ingredient in self.ingredients[:3]])
+
+        self.assertEqual(self.stored(), before)
+
+    def test_rejected_update_keeps_rows(self):
+        before = self.stored()
+
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 1},
+                {'id': self.ingredients[0].pk, 'amount': 2},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored(), before)
+
+
+@override_settings(
+    TOKEN_CACHE_SHARED=False, TOKEN_CACHE_SIZE=2, TOKEN_CACHE_TTL=60
+)
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache()
+
+    def store(self, key, values):
+        self.cache.set(key, values, self.cache.generation())
+
+    def test_least_recently_used_token_is_evicted(self):
+        self.store('a', {'id': 1})
+        self.store('b', {'id': 2})
+        self.assertEqual(self.cache.get('a'), {'id': 1})
+
+        self.store('c', {'id': 3})
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), {'id': 1})
+        self.assertEqual(self.cache.get('c'), {'id': 3})
+
+    def test_entries_expire(self):
+        with mock.patch('api.authentication.time.monotonic', return_value=0):
+            self.store('a', {'id': 1})
+        with mock.patch(
+            'api.authentication.time.monotonic', return_value=60
+        ):
+            self.assertEqual(self.cache.get('a'), {'id': 1})
+        with mock.patch(
+            'api.authentication.time.monotonic', return_value=61
+        ):
+            self.assertIsNone(self.cache.get('a'))
+
+    def test_values_read_before_a_revocation_are_not_stored(self):
+        generation = self.cache.generation()
+        self.cache.delete('b')
+
+        self.cache.set('a', {'id': 1}, generation)
+
+        self.assertIsNone(self.cache.get('a'))
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_shared_cache(self):
+        cache.clear()
+        generation = self.cache.generation()
+        self.store('a', {'id': 1})
+        self.assertEqual(TokenCache().get('a'), {'id': 1})
+
+        TokenCache().delete('a')
+
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('b', {'id': 2}, generation)
+        self.assertIsNone(self.cache.get('b'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(0)
+        self.user.set_password('secret-password')
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def tearDown(self):
+        token_cache.delete(self.token.key)
+
+    def test_cached_user_skips_token_query(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+        with mock.patch.object(
+            Token.objects, 'select_related',
+            side_effect=AssertionError('token read from the database')
+        ):
+            response = self.client.get('/api/users/me/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.user.pk)
+        self.assertNotIn('password', token_cache.get(self.token.key))
+
+    def test_logout_revokes_cached_token(self):
+        self.client.get('/api/users/me/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/users/me/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
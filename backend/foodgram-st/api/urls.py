@@ -1,6 +1,11 @@
 from rest_framework import routers
 from django.urls import path, include
-from api.views import RecipeViewSet, IngredientViewSet, UserViewSet
+from api.views import (
+    RecipeViewSet,
+    IngredientViewSet,
+    UserViewSet,
+    ingredient_list
+)
 
 router = routers.DefaultRouter()
 router.register(
@@ -18,6 +23,7 @@ router.register(
 )
 
 urlpatterns = [
+    path('ingredients/', ingredient_list),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,33 +1,75 @@
+import json
+
 from rest_framework import filters
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from django.db.models import F, Sum
+from django.db.models import (
+    BooleanField, Exists, F, OuterRef, Prefetch, Q, Subquery, Value
+)
 from .serializers import (
     CustomUserReadSerializer,
     CustomUserWriteSerializer,
     CustomUserAvatarSerializer,
     SubscritionSerializer,
+    CookableQuerySerializer,
+    RecipeIdsSerializer,
     RecipeSerializer,
+    ShoppingListItemSerializer,
     SmallRecipeSerializer,
     IngredientSerializer
 )
+from api.cache import (
+    FAVORITES,
+    INGREDIENTS,
+    RECIPES,
+    USERS,
+    AnonymousCacheMixin,
+    ConditionalGetMixin,
+    conditional_response,
+    invalidate_on_commit,
+    recipe_scope,
+    user_scope
+)
+from api.db import ReplicaReadMixin, insert_ignore
 from api.permissions import CustomPermission
+from api.renderers import (
+    CSVRenderer,
+    FallbackContentNegotiation,
+    PDFRenderer,
+    PlainTextRenderer
+)
+from api.shopping_list import SHOPPING_LIST_STREAMS, get_shopping_list
 from djoser.views import UserViewSet as DjoserUser
 from rest_framework import status, viewsets, permissions
 import django_filters
+from recipes.counters import change_counter, recount_counter
+from recipes import feed, shopping_list
+from recipes.matching import recipe_matcher
+from recipes.search import search_recipes
 from recipes.models import (
     Recipe,
     ShoppingCart,
-    Favorite,
-    RecipeIngredient
+    ShoppingListItem,
+    Favorite
 )
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse
+)
 from users.models import Subscribe, CustomUser
 from ingredients.models import Ingredient
-from rest_framework.pagination import PageNumberPagination
+from ingredients.search import ingredient_index
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from asgiref.sync import sync_to_async
 
 
 class Paginator(PageNumberPagination):
@@ -35,6 +77,151 @@ class Paginator(PageNumberPagination):
     page_size = 10
 
 
+class KeysetPaginator(CursorPagination):
+    """Cursor pagination positioned on every field of the ordering.
+
+    DRF keeps only the first ordering field in the cursor and steps over
+    ties with an OFFSET. Here the cursor holds the whole tuple, which is
+    unique as long as the ordering ends with a unique field such as id,
+    so every page is a plain range read.
+    """
+    page_size_query_param = 'limit'
+    page_size = 10
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None if self.cursor is None else self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*(
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in self.ordering
+            ))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = self._filter_after(queryset, position, reverse)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > self.page_size:
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+
+        if reverse:
+            self.page.reverse()
+            self.next_position = position
+            self.previous_position = following_position
+        else:
+            self.next_position = following_position
+            self.previous_position = position
+        self.has_next = self.next_position is not None
+        self.has_previous = self.previous_position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def decode_cursor(self, request):
+        # Positions are unique, so an offset is never needed.
+        cursor = super().decode_cursor(request)
+        return cursor and cursor._replace(offset=0)
+
+    def _filter_after(self, queryset, position, reverse):
+        """Rows past the position: a lexicographic comparison over the
+        ordering fields, plus a bound on the first field alone that the
+        database can use as an index range."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        after = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            after |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') != reverse else 'gte'
+        try:
+            return queryset.filter(
+                Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}), after
+            )
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(str(instance[name]))
+            else:
+                values.append(str(getattr(instance, name)))
+        return json.dumps(values)
+
+
+class OptionalCursorPaginator(Paginator):
+    """Page number pagination, or keyset pagination when the request
+    has a ?cursor= parameter (an empty value starts from the first page).
+
+    Views set cursor_ordering to a stable ordering backed by an index
+    and ending with a unique field, or an ordering for their
+    OrderingFilter which takes precedence.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.cursor_paginator = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = KeysetPaginator()
+        self.cursor_paginator.ordering = getattr(
+            view, 'cursor_ordering', KeysetPaginator.ordering
+        )
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is None:
+            return super().get_paginated_response(data)
+        return self.cursor_paginator.get_paginated_response(data)
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """Adds -id as a tie breaker so equal values do not shuffle
+    between pages.
+
+    Views with a search_ordering use it as the default while ?search= is
+    set, so search results come best match first.
+    """
+    search_param = 'search'
+
+    def get_default_ordering(self, view):
+        search_ordering = getattr(view, 'search_ordering', None)
+        if search_ordering and view.request.query_params.get(
+            self.search_param
+        ):
+            return search_ordering
+        return super().get_default_ordering(view)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering = [*ordering, '-id']
+        return ordering
+
+
 class RecipeFilter(django_filters.FilterSet):
     is_in_shopping_cart = django_filters.CharFilter(
         method='filter_is_in_shopping_cart'
@@ -42,10 +229,14 @@ class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.CharFilter(
         method='filter_is_favorited'
     )
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ['is_in_shopping_cart', 'is_favorited', 'author']
+        fields = ['is_in_shopping_cart', 'is_favorited', 'author', 'search']
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value.strip())
 
     def filter_is_favorited(self, queryset, name, value):
         current_user = self.request.user
@@ -53,9 +244,9 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset
 
         if value == "1":
-            return queryset.filter(favorite__user=current_user)
+            return queryset.filter(is_favorited=True)
         elif value == "0":
-            return queryset.exclude(favorite__user=current_user)
+            return queryset.filter(is_favorited=False)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
@@ -65,30 +256,134 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset
 
         if value == '1':
-            return queryset.filter(shopping_cart__user=current_user)
+            return queryset.filter(is_in_shopping_cart=True)
         elif value == '0':
-            return queryset.exclude(shopping_cart__user=current_user)
+            return queryset.filter(is_in_shopping_cart=False)
         return queryset
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+def invalidate_user_state(user_id, model_class):
+    """Expire ETags of responses showing the user's favorites, cart or
+    subscriptions once the change commits."""
+    scopes = [user_scope(user_id)]
+    if model_class is Favorite:
+        scopes.append(FAVORITES)
+    invalidate_on_commit(scopes)
+
+
+def get_recipes_queryset(current_user):
+    """Recipes with everything RecipeSerializer reads, so rendering a
+    page takes a fixed number of queries."""
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'ingredient_recipe__ingredient'
+    ).defer('search_vector')
+
+    if not current_user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Value(False, output_field=BooleanField()),
+            is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            is_author_subscribed=Value(False, output_field=BooleanField())
+        )
+
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(
+                user=current_user, recipe=OuterRef('pk')
+            )
+        ),
+        is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(
+                user=current_user, recipe=OuterRef('pk')
+            )
+        ),
+        is_author_subscribed=Exists(
+            Subscribe.objects.filter(
+                user=current_user, author=OuterRef('author')
+            )
+        )
+    )
+
+
+class IngredientViewSet(
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    AnonymousCacheMixin,
+    viewsets.ModelViewSet
+):
     queryset = Ingredient.objects.all()
     http_method_names = ['get']
     serializer_class = IngredientSerializer
-    filterset_fields = ['name']
+    cache_scope = INGREDIENTS
     filter_backends = (DjangoFilterBackend, filters.SearchFilter)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+ingredient_list_view = IngredientViewSet.as_view({'get': 'list'})
+
+
+async def ingredient_list(request):
+    """GET /api/ingredients/. Autocomplete requests (?name=, a prefix
+    search, or anywhere in the name with &contains=1) are answered from
+    the in-process index without leaving the event loop under ASGI, the
+    rest goes to IngredientViewSet."""
+    name = request.GET.get('name')
+    if request.method != 'GET' or not name:
+        return await sync_to_async(ingredient_list_view)(request)
+    return JsonResponse(
+        await ingredient_index.asearch(
+            name, contains=request.GET.get('contains') == '1'
+        ),
+        safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')}
+    )
+
+
+# Like DRF views; csrf_exempt of Django 4.1 would make the view sync.
+ingredient_list.csrf_exempt = True
+ingredient_list.metrics_name = 'IngredientViewSet.list'
+
+
+class RecipeViewSet(
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    AnonymousCacheMixin,
+    viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    filter_backends = [DjangoFilterBackend]
-    pagination_class = Paginator
+    filter_backends = [DjangoFilterBackend, StableOrderingFilter]
+    pagination_class = OptionalCursorPaginator
+    ordering_fields = ('created', 'favorites_count')
+    ordering = ('-created', '-id')
+    search_ordering = ('-search_rank', '-id')
     permission_classes = [CustomPermission]
     filterset_class = RecipeFilter
-
+    cache_scope = RECIPES
+    etag_user_state = True
+
+    def get_queryset(self):
+        return get_recipes_queryset(self.request.user)
+
+    def get_cache_scopes(self, request):
+        scopes = super().get_cache_scopes(request)
+        if self.action == 'retrieve':
+            # A recipe page only changes with the recipe itself, its
+            # ingredients and its author, not with the rest of the catalog.
+            scopes[0] = recipe_scope(self.kwargs['pk'])
+            scopes += [INGREDIENTS, USERS]
+        elif 'favorites_count' in request.query_params.get('ordering', ''):
+            scopes.append(FAVORITES)
+        return scopes
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        change_counter(CustomUser, [self.request.user.pk], 'recipes_count', 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with shopping_list.batch([instance.pk]):
+            instance.delete()
+        change_counter(CustomUser, [instance.author_id], 'recipes_count', -1)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
@@ -98,17 +393,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def handle_recipe(
-        request, serializer_class, model_class, recipe_id
+        request, serializer_class, model_class, recipe_id, counter_field
     ):
-        current_recipe = get_object_or_404(Recipe, pk=recipe_id)
         current_user = request.user
 
         if request.method == 'POST':
-            recipe_exists = model_class.objects.filter(
-                recipe=current_recipe,
-                user=current_user
-            ).exists()
-            if recipe_exists:
+            current_recipe = get_object_or_404(Recipe, pk=recipe_id)
+            try:
+                with transaction.atomic():
+                    created = insert_ignore(
+                        model_class,
+                        user_id=current_user.pk,
+                        recipe_id=current_recipe.pk
+                    )
+                    if created:
+                        change_counter(
+                            Recipe, [current_recipe.pk], counter_field, 1
+                        )
+                        invalidate_user_state(current_user.pk, model_class)
+                        if model_class is ShoppingCart:
+                            shopping_list.add_recipes(
+                                current_user.pk, [current_recipe.pk]
+                            )
+            except IntegrityError:
+                raise Http404
+            if not created:
                 return Response(
                     {
                         'Нельзя добавить один рецепт несколько раз'
@@ -119,17 +428,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 current_recipe,
                 context={'request': request}
             )
-            model_class.objects.create(
-                user=current_user,
-                recipe=current_recipe
-            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        deleted_count, _ = model_class.objects.filter(
-            user=current_user, recipe=current_recipe
-        ).delete()
+        with transaction.atomic():
+            deleted_count, _ = model_class.objects.filter(
+                user=current_user, recipe_id=recipe_id
+            ).delete()
+            if deleted_count:
+                change_counter(
+                    Recipe, [recipe_id], counter_field, -deleted_count
+                )
+                invalidate_user_state(current_user.pk, model_class)
 
         if deleted_count == 0:
+            get_object_or_404(Recipe, pk=recipe_id)
             return Response(
                 {'Рецепта нет в списке'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -140,54 +452,194 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk=None):
         return self.handle_recipe(
-            request, SmallRecipeSerializer, Favorite, pk
+            request, SmallRecipeSerializer, Favorite, pk, 'favorites_count'
         )
 
     @action(detail=True, methods=['delete', 'post'],
             permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, pk=None):
         return self.handle_recipe(
-            request, SmallRecipeSerializer, ShoppingCart, pk
+            request, SmallRecipeSerializer, ShoppingCart, pk,
+            'shopping_cart_count'
+        )
+
+    @staticmethod
+    def handle_recipes_batch(request, model_class, counter_field):
+        """Add or remove many recipes at once.
+
+        Recipes and their current state are read with one IN query and
+        written with one INSERT or DELETE. Returns a status per id:
+        added/exists on POST, removed/absent on DELETE, not_found for
+        unknown recipes.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+
+        with transaction.atomic():
+            # Requests of the same user are serialized, so the state read
+            # below still holds when the changes are written.
+            list(
+                CustomUser.objects.select_for_update().filter(
+                    pk=request.user.pk
+                ).values_list('pk', flat=True)
+            )
+            linked = dict(
+                Recipe.objects.filter(pk__in=recipe_ids).annotate(
+                    linked=Exists(
+                        model_class.objects.filter(
+                            user=request.user, recipe=OuterRef('pk')
+                        )
+                    )
+                ).values_list('pk', 'linked')
+            )
+
+            if request.method == 'POST':
+                changed = {pk for pk, is_linked in linked.items()
+                           if not is_linked}
+                model_class.objects.bulk_create(
+                    [
+                        model_class(user=request.user, recipe_id=pk)
+                        for pk in changed
+                    ],
+                    ignore_conflicts=True
+                )
+                if model_class is ShoppingCart:
+                    shopping_list.add_recipes(request.user.pk, changed)
+                statuses = ('added', 'exists')
+            else:
+                changed = {pk for pk, is_linked in linked.items()
+                           if is_linked}
+                with shopping_list.batch(
+                    changed if model_class is ShoppingCart else ()
+                ):
+                    model_class.objects.filter(
+                        user=request.user, recipe_id__in=changed
+                    ).delete()
+                statuses = ('removed', 'absent')
+            if changed:
+                recount_counter(Recipe, changed, counter_field)
+                invalidate_user_state(request.user.pk, model_class)
+
+        return Response({
+            'results': [
+                {
+                    'id': pk,
+                    'status': (
+                        'not_found' if pk not in linked
+                        else statuses[0] if pk in changed
+                        else statuses[1]
+                    )
+                }
+                for pk in recipe_ids
+            ]
+        })
+
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """Recipes that can be cooked from the given ingredients, fully
+        cookable first, then by fewest missing ingredients."""
+        params = {'ingredients': request.query_params.getlist('ingredients')}
+        if 'max_missing' in request.query_params:
+            params['max_missing'] = request.query_params['max_missing']
+        query = CookableQuerySerializer(data=params)
+        query.is_valid(raise_exception=True)
+        matches = recipe_matcher.match(
+            query.validated_data['ingredients'],
+            query.validated_data.get('max_missing')
+        )
+
+        paginator = Paginator()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        data = []
+        for recipe_id, missing in page:
+            # The index may be a little behind recipes deleted meanwhile.
+            if recipe_id in recipes:
+                item = self.get_serializer(recipes[recipe_id]).data
+                item['missing_ingredients'] = missing
+                data.append(item)
+        return paginator.get_paginated_response(data)
+
+    @action(detail=False, methods=['delete', 'post'],
+            url_path='favorite/batch',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.handle_recipes_batch(
+            request, Favorite, 'favorites_count'
+        )
+
+    @action(detail=False, methods=['delete', 'post'],
+            url_path='shopping_cart/batch',
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.handle_recipes_batch(
+            request, ShoppingCart, 'shopping_cart_count'
         )
 
     @action(
         detail=False,
         permission_classes=[IsAuthenticated],
-        methods=['get']
+        methods=['get'],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer],
+        content_negotiation_class=FallbackContentNegotiation
     )
     def download_shopping_cart(self, request):
-        shopping_cart_items = request.user.shopping_cart.all()
-
-        if not shopping_cart_items.exists():
-            return Response({'Корзина пуста.'}, status=status.HTTP_404_NOT_FOUND)
-
-        recipe_ids = shopping_cart_items.values_list('recipe_id', flat=True)
-        
-        ingredients = RecipeIngredient.objects.filter(
-            recipe_id__in=recipe_ids
-        ).values(
-            name=F('ingredient__name'),
-            unit=F('ingredient__measurement_unit')
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('ingredient__name')
-        
-        shopping_cart_list = [
-            f"{item['name']}: {item['total_amount']} {item['unit']}"
-            for item in ingredients
-        ]
-
-        return FileResponse(
-            "\n".join(shopping_cart_list),
-            as_attachment=True,
-            filename="shopping_list.txt",
-            content_type="text/plain; charset=utf-8",
+        if not request.user.shopping_cart.exists():
+            return HttpResponse(
+                'Корзина пуста.',
+                status=status.HTTP_404_NOT_FOUND,
+                content_type='text/plain; charset=utf-8'
+            )
+
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+
+        content = SHOPPING_LIST_STREAMS[renderer.format](
+            get_shopping_list(request.user)
+        )
+        if isinstance(request._request, ASGIRequest):
+            # Under ASGI Django 4.1 iterates streaming responses in the
+            # event loop, where the lazy query of the list cannot run, so
+            # the file is rendered here and the server sends it.
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                content, content_type=content_type
+            )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
+        )
+        return response
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        methods=['get'],
+        url_path='shopping_list'
+    )
+    def current_shopping_list(self, request):
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient_id'
         )
+        return Response(ShoppingListItemSerializer(items, many=True).data)
 
 
-class UserViewSet(DjoserUser):
+class UserViewSet(ReplicaReadMixin, DjoserUser):
     queryset = CustomUser.objects.all()
-    pagination_class = Paginator
+    pagination_class = OptionalCursorPaginator
+
+    @property
+    def cursor_ordering(self):
+        if self.action == 'subscriptions':
+            return ('subscription_id',)
+        return ('id',)
 
     def get_serializer_class(self):
         if self.action in ["list", "retrieve", "me"]:
@@ -207,16 +659,33 @@ class UserViewSet(DjoserUser):
             user_data.pop('is_subscribed', None)
             return Response(user_data, status=status.HTTP_201_CREATED)
 
+    def get_subscriptions_queryset(self):
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit')
+
+        if limit and limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(limit)]
+            ))
+
+        return CustomUser.objects.filter(
+            authors__user=self.request.user
+        ).annotate(
+            subscription_id=F('authors__id'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('subscription_id')
+
     @action(
         methods=['GET'],
         detail=False,
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        subscribes = Subscribe.objects.filter(
-            user=request.user).select_related('author')
-        authors = [sub.author for sub in subscribes]
-        pages = self.paginate_queryset(authors)
+        pages = self.paginate_queryset(self.get_subscriptions_queryset())
 
         serializer = SubscritionSerializer(
             pages,
@@ -226,6 +695,33 @@ class UserViewSet(DjoserUser):
 
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        return conditional_response(
+            request,
+            [RECIPES, USERS, user_scope(request.user.pk)],
+            self._feed_page
+        )
+
+    def _feed_page(self, request):
+        paginator = KeysetPaginator()
+        paginator.ordering = ("-id",)
+        recipes = paginator.paginate_queryset(
+            feed.filter_feed(get_recipes_queryset(request.user), request.user),
+            request,
+            view=self
+        )
+        serializer = RecipeSerializer(
+            recipes,
+            many=True,
+            context={"request": request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         methods=["delete", "post"],
         detail=True,
@@ -236,19 +732,24 @@ class UserViewSet(DjoserUser):
         author = self.get_object()
 
         if request.method == "POST":
-
-            subscribtion, create = Subscribe.objects.get_or_create(
-                author=author,
-                user=subscriber
-            )
-
             if author == subscriber:
                 return Response(
                     {"Невозможно подписаться на себя"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            if not create:
+            with transaction.atomic():
+                created = insert_ignore(
+                    Subscribe, user_id=subscriber.pk, author_id=author.pk
+                )
+                if created:
+                    change_counter(
+                        CustomUser, [author.pk], "followers_count", 1
+                    )
+                    invalidate_user_state(subscriber.pk, Subscribe)
+                    feed.follow(subscriber.pk, author)
+
+            if not created:
                 return Response(
                     {
                         "Вы уже подписаны на этого пользователя "
@@ -257,18 +758,24 @@ class UserViewSet(DjoserUser):
                 )
 
             serializer = SubscritionSerializer(
-                subscriber,
+                author,
                 context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        try:
-            get_object_or_404(
-                Subscribe,
+        with transaction.atomic():
+            deleted_count, _ = Subscribe.objects.filter(
                 author=author,
                 user=subscriber
             ).delete()
-        except Exception:
+            if deleted_count:
+                change_counter(
+                    CustomUser, [author.pk], "followers_count", -1
+                )
+                invalidate_user_state(subscriber.pk, Subscribe)
+                feed.unfollow(subscriber.pk, author.pk)
+
+        if deleted_count == 0:
             return Response(
                 status=status.HTTP_400_BAD_REQUEST
             )
@@ -291,7 +798,7 @@ class UserViewSet(DjoserUser):
 
         if request.method == 'DELETE':
             current_user.avatar.delete(save=False)
-            current_user.save()
+            current_user.save(update_fields=['avatar'])
             return Response(
                 {'Аватар удален.'},
                 status=status.HTTP_204_NO_CONTENT
@@ -324,7 +831,7 @@ class UserViewSet(DjoserUser):
             )
 
         current_user.set_password(new_password)
-        current_user.save()
+        current_user.save(update_fields=['password'])
         return Response(
             {'Пароль успешно изменен'},
             status=status.HTTP_204_NO_CONTENT
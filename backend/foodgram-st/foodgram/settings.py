@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +94,17 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# wsgi or asgi, see gunicorn.conf.py.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+# Connections are kept for DB_CONN_MAX_AGE seconds and checked before being
+# reused. ASGI requests run in short-lived threads that cannot reuse them,
+# so the default there is a connection per request. DB_POOL_MODE=transaction
+# is for pgbouncer in transaction pooling mode, where consecutive
+# transactions may get different server connections, so server-side
+# cursors are turned off.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "session")
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -101,9 +113,33 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'PORT': os.getenv('DB_PORT'),
         'HOST': os.getenv('DB_HOST'),
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE', 0 if SERVER_MODE == 'asgi' else 60
+        )),
+        'CONN_HEALTH_CHECKS': bool(int(
+            os.getenv('DB_CONN_HEALTH_CHECKS', True)
+        )),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'transaction',
     }
 }
 
+# Read replicas of the default database, comma separated hosts with the
+# same name and credentials. Safe requests to the recipe, ingredient and
+# user endpoints read from a random replica, except for
+# DB_REPLICA_PIN_SECONDS after the user (or anyone, for catalog changes)
+# wrote something, when replicas may still lag behind.
+for index, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -166,7 +202,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework.filters.SearchFilter',
@@ -179,3 +215,68 @@ REST_FRAMEWORK = {
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
+
+
+# Without REDIS_URL every worker process keeps its own local-memory cache
+# and only sees invalidations made by itself, so keep API_CACHE_TIMEOUT
+# short in that mode.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'foodgram',
+        }
+    }
+
+API_CACHE_TIMEOUT = int(os.getenv("API_CACHE_TIMEOUT", 60))
+
+# ETags of recipe and ingredient responses are built from the cache
+# generations and never expire, so they are only safe with a shared cache.
+API_ETAGS = bool(int(os.getenv("API_ETAGS", bool(os.getenv("REDIS_URL")))))
+
+# Authenticated users are cached by token for TOKEN_CACHE_TTL seconds, in
+# each worker process (at most TOKEN_CACHE_SIZE tokens) or, with
+# TOKEN_CACHE_SHARED, in the shared cache so logout and password changes
+# reach every worker at once.
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 60))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_SHARED = bool(int(
+    os.getenv("TOKEN_CACHE_SHARED", bool(os.getenv("REDIS_URL")))
+))
+
+# Requests running more SQL queries than this are logged as warnings.
+REQUEST_QUERY_BUDGET = int(os.getenv("REQUEST_QUERY_BUDGET", 20))
+
+# /metrics/ answers only these client addresses, or requests with an
+# "Authorization: Bearer <METRICS_TOKEN>" header when a token is set.
+METRICS_ALLOWED_IPS = [
+    ip.strip()
+    for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+    if ip.strip()
+]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Processes rendering recipe thumbnails, 0 renders them inline.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+INGREDIENT_INDEX_TTL = int(os.getenv("INGREDIENT_INDEX_TTL", 300))
+RECIPE_MATCHER_TTL = int(os.getenv("RECIPE_MATCHER_TTL", 300))
+
+# New recipes are copied into the feeds of at most this many followers;
+# feeds read recipes of authors with more followers directly.
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 10000))
+# Latest recipes of an author added to the feed on subscription.
+FEED_BACKFILL_SIZE = int(os.getenv("FEED_BACKFILL_SIZE", 20))
+# PostgreSQL text search configuration used for recipe search.
+RECIPE_SEARCH_CONFIG = os.getenv("RECIPE_SEARCH_CONFIG", "russian")
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
@@ -0,0 +1,51 @@
+"""Gunicorn settings.
+
+SERVER_MODE=wsgi (default) serves foodgram.wsgi with sync workers,
+SERVER_MODE=asgi serves foodgram.asgi with uvicorn workers, where slow
+clients and large responses are sent from the event loop instead of
+holding a worker process.
+"""
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    default_workers = multiprocessing.cpu_count()
+else:
+    wsgi_app = "foodgram.wsgi:application"
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+
+workers = int(os.getenv("WEB_CONCURRENCY", default_workers))
+
+# Workers write /metrics/ series to files here, so a scrape of any worker
+# reports all of them.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/foodgram-metrics")
+
+
+def on_starting(server):
+    """Drop metric files of the previous run and run Django system checks
+    before forking workers, so a misconfigured deployment fails at once
+    instead of on the first request."""
+    import django
+    from django.core.management import call_command
+    from django.db import connections
+
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
+    django.setup()
+    call_command("check")
+    connections.close_all()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
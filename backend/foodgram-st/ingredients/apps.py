@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class IngredientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ingredients'
+
+    def ready(self):
+        from .models import Ingredient
+        from .search import ingredient_index
+
+        post_save.connect(
+            ingredient_index.invalidate_on_commit,
+            sender=Ingredient,
+            dispatch_uid='ingredient_index_save'
+        )
+        post_delete.connect(
+            ingredient_index.invalidate_on_commit,
+            sender=Ingredient,
+            dispatch_uid='ingredient_index_delete'
+        )
@@ -1,50 +1,267 @@
+import csv
+import io
 import json
+import os
+from itertools import islice
+
+from api.cache import INGREDIENTS, RECIPES, invalidate
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from ingredients.models import Ingredient
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Yield items of a top-level JSON array without loading the file."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != "[":
+                raise json.JSONDecodeError(
+                    "Expected a JSON array", buffer, position
+                )
+            started = True
+            position += 1
+            continue
+        if started and buffer[position:position + 1] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if not row or row == ["name", "measurement_unit"]:
+            continue
+        yield {"name": row[0], "measurement_unit": row[1]}
+
+
+READERS = {
+    ".json": iter_json,
+    ".csv": iter_csv,
+}
+
+
+def iter_ingredients(file, reader):
+    for item in reader(file):
+        name = item["name"].strip().lower()
+        measurement_unit = item["measurement_unit"].strip().lower()
+        if name and measurement_unit:
+            yield name, measurement_unit
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class _CSVStream(io.RawIOBase):
+    """File-like object feeding rows to COPY ... FROM STDIN."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = b""
+        self._line = io.StringIO()
+        self._writer = csv.writer(self._line)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._line.seek(0)
+            self._line.truncate()
+            self._writer.writerow(row)
+            self._buffer += self._line.getvalue().encode("utf-8")
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
 
 class Command(BaseCommand):
-    help = "Load ingredients from JSON file"
+    help = (
+        "Load ingredients from JSON or CSV files, updating measurement "
+        "units of ingredients that already exist"
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("file_path", type=str, help="Path to JSON file with ingridients")
+        parser.add_argument(
+            "file_paths",
+            nargs="+",
+            type=str,
+            help="Paths to JSON or CSV files with ingredients",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of ingredients written per query",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Do not use COPY on PostgreSQL",
+        )
 
     def handle(self, *args, **options):
-        file_path = options["file_path"]
+        for file_path in options["file_paths"]:
+            reader = READERS.get(os.path.splitext(file_path)[1].lower())
+            if reader is None:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"File {file_path} is neither JSON nor CSV"
+                    )
+                )
+                continue
 
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
+            try:
+                with open(file_path, "r", encoding="utf-8") as file:
+                    rows = iter_ingredients(file, reader)
+                    if (
+                        connection.vendor == "postgresql"
+                        and not options["no_copy"]
+                    ):
+                        counts = self._load_with_copy(rows)
+                    else:
+                        counts = self._load_in_batches(
+                            rows, options["batch_size"]
+                        )
 
-            with transaction.atomic():
-                ingredients_to_create = [
-                    Ingredient(
-                        name=item["name"].lower(),
-                        measurement_unit=item["measurement_unit"].lower(),
+                inserted, updated, _ = counts
+                if inserted or updated:
+                    # Bulk writes and COPY send no signals; recipes show
+                    # measurement units too.
+                    invalidate(INGREDIENTS, RECIPES)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        "{}: inserted {}, updated {}, skipped {}".format(
+                            file_path, *counts
+                        )
                     )
-                    for item in data
-                ]
+                )
 
-                Ingredient.objects.bulk_create(
-                    ingredients_to_create,
-                    ignore_conflicts=True,
+            except FileNotFoundError:
+                self.stdout.write(
+                    self.style.ERROR(f"File {file_path} not found")
+                )
+            except json.JSONDecodeError:
+                self.stdout.write(
+                    self.style.ERROR(f"File {file_path} is not valid JSON")
                 )
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f"Error loading ingredients: {str(e)}")
+                )
+
+    def _load_in_batches(self, rows, batch_size):
+        inserted = updated = skipped = 0
+
+        for batch in batched(rows, batch_size):
+            incoming = dict(batch)
+            skipped += len(batch) - len(incoming)
+
+            existing = {}
+            for ingredient in Ingredient.objects.filter(
+                name__in=incoming
+            ):
+                existing.setdefault(ingredient.name, []).append(ingredient)
+
+            to_create = []
+            to_update = []
+            for name, measurement_unit in incoming.items():
+                ingredients = existing.get(name, [])
+                units = {
+                    ingredient.measurement_unit for ingredient in ingredients
+                }
+                if measurement_unit in units:
+                    skipped += 1
+                elif len(ingredients) == 1:
+                    ingredients[0].measurement_unit = measurement_unit
+                    to_update.append(ingredients[0])
+                else:
+                    to_create.append(
+                        Ingredient(
+                            name=name, measurement_unit=measurement_unit
+                        )
+                    )
 
-            total_ingredients = len(ingredients_to_create)
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"Successfully loaded {total_ingredients} ingredients"
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(to_create)
+                Ingredient.objects.bulk_update(
+                    to_update, ["measurement_unit"]
                 )
-            )
+            inserted += len(to_create)
+            updated += len(to_update)
 
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"File {file_path} not found"))
-        except json.JSONDecodeError:
-            self.stdout.write(
-                self.style.ERROR(f"File {file_path} is not valid JSON")
+        return inserted, updated, skipped
+
+    def _load_with_copy(self, rows):
+        """Stream rows into a temporary table with COPY and merge it with
+        set-based statements following the same rules as the batch path."""
+        table = Ingredient._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE ingredient_import ("
+                "position bigserial, name text, measurement_unit text"
+                ") ON COMMIT DROP"
             )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f"Error loading ingredients: {str(e)}")
-            )
\ No newline at end of file
+            cursor.copy_expert(
+                "COPY ingredient_import (name, measurement_unit) "
+                "FROM STDIN WITH (FORMAT csv)",
+                _CSVStream(rows),
+            )
+            cursor.execute("SELECT count(*) FROM ingredient_import")
+            (total,) = cursor.fetchone()
+            cursor.execute(
+                "CREATE TEMP TABLE ingredient_import_unique "
+                "ON COMMIT DROP AS "
+                "SELECT DISTINCT ON (name) name, measurement_unit "
+                "FROM ingredient_import ORDER BY name, position DESC"
+            )
+            cursor.execute(
+                f"UPDATE {table} AS i "
+                "SET measurement_unit = s.measurement_unit "
+                "FROM ingredient_import_unique AS s "
+                "WHERE i.name = s.name "
+                "AND i.measurement_unit <> s.measurement_unit "
+                f"AND (SELECT count(*) FROM {table} AS j "
+                "WHERE j.name = i.name) = 1"
+            )
+            updated = cursor.rowcount
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT s.name, s.measurement_unit "
+                "FROM ingredient_import_unique AS s "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {table} AS i "
+                "WHERE i.name = s.name "
+                "AND i.measurement_unit = s.measurement_unit) "
+                "ON CONFLICT DO NOTHING"
+            )
+            inserted = cursor.rowcount
+
+        return inserted, updated, total - inserted - updated
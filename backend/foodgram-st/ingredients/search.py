@@ -0,0 +1,116 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """In-process sorted index of ingredient names for autocomplete.
+
+    The index is built lazily from the database on the first search and
+    dropped whenever a save or delete of an ingredient commits in this
+    process.
+    Other worker processes pick changes up after INGREDIENT_INDEX_TTL
+    seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._items = []
+        self._built_at = None
+        self._generation = 0
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self._built_at = None
+            self._generation += 1
+
+    def invalidate_on_commit(self, *args, **kwargs):
+        # A rebuild before the commit would cache the old rows again.
+        transaction.on_commit(self.invalidate)
+
+    def search(self, query, contains=False):
+        """Ingredients whose name starts with the query. With contains,
+        names containing it anywhere follow the prefix matches."""
+        index, generation = self._get_fresh_index()
+        if index is None:
+            index = self._build(self._rows(), generation)
+        return self._search(index, query, contains)
+
+    async def asearch(self, query, contains=False):
+        """search for async views: a built index is searched right in the
+        event loop, a stale one is reloaded with the async ORM."""
+        index, generation = self._get_fresh_index()
+        if index is None:
+            index = self._build(
+                [row async for row in self._rows()], generation
+            )
+        return self._search(index, query, contains)
+
+    @staticmethod
+    def _search(index, query, contains):
+        keys, items = index
+        query = query.strip().casefold()
+        if not query:
+            return list(items)
+
+        prefix_matches = []
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            prefix_matches.append(position)
+            position += 1
+        if not contains:
+            return [items[position] for position in prefix_matches]
+
+        found = set(prefix_matches)
+        substring_matches = [
+            position for position, key in enumerate(keys)
+            if position not in found and query in key
+        ]
+        return [items[position] for position in prefix_matches] + [
+            items[position] for position in substring_matches
+        ]
+
+    def _get_fresh_index(self):
+        """The built index or None when it has to be rebuilt, with the
+        generation to pass to _build."""
+        ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+        with self._lock:
+            if (
+                self._built_at is None
+                or time.monotonic() - self._built_at > ttl
+            ):
+                return None, self._generation
+            return (self._keys, self._items), self._generation
+
+    @staticmethod
+    def _rows():
+        return Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+
+    def _build(self, rows, generation):
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[0]))
+        keys = [name.casefold() for _, name, _ in rows]
+        items = [
+            {
+                'id': ingredient_id,
+                'measurement_unit': measurement_unit,
+                'name': name,
+            }
+            for ingredient_id, name, measurement_unit in rows
+        ]
+        with self._lock:
+            # Rows read before an invalidation still answer this search but
+            # are not kept.
+            if self._generation == generation:
+                self._keys = keys
+                self._items = items
+                self._built_at = time.monotonic()
+        return keys, items
+
+
+ingredient_index = IngredientIndex()
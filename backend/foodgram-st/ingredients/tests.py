@@ -0,0 +1,118 @@
+import io
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ingredients.management.commands import load_ingredients_database
+from ingredients.management.commands.load_ingredients_database import (
+    iter_json
+)
+from ingredients.models import Ingredient
+
+ITEMS = [
+    {'name': 'соль, крупная', 'measurement_unit': 'г'},
+    {'name': 'скобки ] и [', 'measurement_unit': 'шт'},
+    {'name': 'кавычки "', 'measurement_unit': 'мл'},
+]
+
+
+class IterJsonTests(TestCase):
+
+    def read(self, text, chunk_size=3):
+        with mock.patch.object(
+            load_ingredients_database, 'READ_CHUNK_SIZE', chunk_size
+        ):
+            return list(iter_json(io.StringIO(text)))
+
+    def test_items_split_across_chunks(self):
+        text = json.dumps(ITEMS, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 2, 3, 7, len(text)):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.read(text, chunk_size), ITEMS)
+
+    def test_empty_array(self):
+        self.assertEqual(self.read(' [ ] '), [])
+
+    def test_not_an_array(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self.read(json.dumps(ITEMS[0]))
+
+    def test_truncated_input(self):
+        text = json.dumps(ITEMS)
+        with self.assertRaises(json.JSONDecodeError):
+            self.read(text[:len(text) // 2])
+
+
+class LoadIngredientsDatabaseTests(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, file_name, content):
+        path = os.path.join(self.directory.name, file_name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        stdout = io.StringIO()
+        call_command('load_ingredients_database', path, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_inserts_updates_and_skips(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        # A name stored with two units is ambiguous and never updated.
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        Ingredient.objects.create(name='мука', measurement_unit='кг')
+
+        output = self.load('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'кг'},
+            {'name': 'перец', 'measurement_unit': 'г'},
+            {'name': ' Перец ', 'measurement_unit': 'Г'},
+            {'name': 'мука', 'measurement_unit': 'стакан'},
+            {'name': '', 'measurement_unit': 'г'},
+        ], ensure_ascii=False))
+
+        self.assertIn('inserted 2, updated 1, skipped 2', output)
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {
+                ('соль', 'г'),
+                ('сахар', 'кг'),
+                ('перец', 'г'),
+                ('мука', 'г'),
+                ('мука', 'кг'),
+                ('мука', 'стакан'),
+            }
+        )
+
+    def test_csv_header_is_skipped(self):
+        output = self.load(
+            'ingredients.csv',
+            'name,measurement_unit\nсоль,г\n\n"мука, пшеничная",г\n'
+        )
+
+        self.assertIn('inserted 2, updated 0, skipped 0', output)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['мука, пшеничная', 'соль']
+        )
+
+    def test_second_load_changes_nothing(self):
+        content = json.dumps(ITEMS, ensure_ascii=False)
+        self.load('ingredients.json', content)
+
+        output = self.load('ingredients.json', content)
+
+        self.assertIn('inserted 0, updated 0, skipped 3', output)
+        self.assertEqual(Ingredient.objects.count(), len(ITEMS))
+
+    def test_invalid_json_is_reported(self):
+        output = self.load('ingredients.json', '[{"name": "соль"')
+
+        self.assertIn('is not valid JSON', output)
+        self.assertFalse(Ingredient.objects.exists())
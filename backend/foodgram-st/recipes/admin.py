@@ -18,8 +18,11 @@ class AdminRecipe(admin.ModelAdmin):
     search_fields = ('name', 'author__username')
     inlines = [AdminRecipeIngredientInline]
 
+    @admin.display(
+        description='Добавлений в избранное', ordering='favorites_count'
+    )
     def count_recipes_favorites(self, object):
-        return object.favorite.count()
+        return object.favorites_count
 
     def get_username(self, object):
         return object.user.username
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from .matching import recipe_matcher
+        from .models import Recipe, RecipeIngredient
+        from .shopping_list import RECEIVERS
+
+        for model in (Recipe, RecipeIngredient):
+            for action, signal in (
+                ('save', post_save), ('delete', post_delete)
+            ):
+                signal.connect(
+                    recipe_matcher.refresh_on_commit,
+                    sender=model,
+                    dispatch_uid=f'recipe_matcher_{action}_{model.__name__}'
+                )
+
+        for model, *handlers in RECEIVERS:
+            for handler, (action, signal) in zip(handlers, (
+                ('pre_save', pre_save),
+                ('save', post_save),
+                ('delete', post_delete)
+            )):
+                signal.connect(
+                    handler,
+                    sender=model,
+                    dispatch_uid=f'shopping_list_{action}_{model.__name__}'
+                )
@@ -0,0 +1,66 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (model, counter field, related model, foreign key to the counted object)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    (
+        'recipes.Recipe', 'shopping_cart_count',
+        'recipes.ShoppingCart', 'recipe'
+    ),
+    ('users.CustomUser', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.CustomUser', 'followers_count', 'users.Subscribe', 'author'),
+)
+
+
+def change_counter(model, pks, field, delta):
+    """Shift a counter column with F() so concurrent requests do not lose
+    updates. Counters never go below zero, reconcile_counters fixes any
+    drift."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def _actual_count(related, foreign_key):
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def recount_counter(model, pks, field):
+    """Set a counter column of the given rows from the related rows in a
+    single UPDATE, for writes that touch many rows at once."""
+    for model_name, counter_field, related_name, foreign_key in COUNTERS:
+        if model_name == model._meta.label and counter_field == field:
+            related = global_apps.get_model(related_name)
+            return model.objects.filter(pk__in=pks).update(
+                **{field: _actual_count(related, foreign_key)}
+            )
+    raise ValueError(f'{model._meta.label}.{field} is not a counter')
+
+
+def reconcile_counters():
+    """Recount every counter column from the related rows.
+
+    Returns the number of corrected rows per counter.
+    """
+    corrected = {}
+    for model_name, field, related_name, foreign_key in COUNTERS:
+        model = global_apps.get_model(model_name)
+        actual = _actual_count(
+            global_apps.get_model(related_name), foreign_key
+        )
+        corrected[f'{model.__name__}.{field}'] = model.objects.exclude(
+            **{field: actual}
+        ).update(**{field: actual})
+    return corrected
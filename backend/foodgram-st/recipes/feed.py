@@ -0,0 +1,104 @@
+"""Subscription feeds, built by fan-out on write.
+
+A new recipe is copied into FeedEntry rows of every follower of its
+author, so reading a feed is one range scan of the follower's entries.
+Authors with more than FEED_FANOUT_LIMIT followers are not fanned out;
+their recipes are merged into the feed when it is read.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import Subscribe
+
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+
+
+def _fans_out(author):
+    return author.followers_count <= settings.FEED_FANOUT_LIMIT
+
+
+def fan_out(recipe):
+    """Add a new recipe to the feeds of its author's followers."""
+    if not _fans_out(recipe.author):
+        return
+    follower_ids = Subscribe.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe.pk)
+            for user_id in follower_ids.iterator(chunk_size=BATCH_SIZE)
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def follow(user_id, author):
+    """Backfill the feed with the latest recipes of a new subscription."""
+    if not _fans_out(author):
+        return
+    recipe_ids = Recipe.objects.filter(
+        author_id=author.pk
+    ).order_by('-id').values_list('id', flat=True)[
+        :settings.FEED_BACKFILL_SIZE
+    ]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        ],
+        ignore_conflicts=True
+    )
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def filter_feed(recipes, user):
+    """Narrow a Recipe queryset down to the user's feed."""
+    big_author_ids = list(
+        Subscribe.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+    if not big_author_ids:
+        return recipes.filter(feed_entries__user=user)
+    return recipes.filter(
+        Q(pk__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=big_author_ids)
+    )
+
+
+def rebuild_feeds():
+    """Refill every feed with the latest FEED_BACKFILL_SIZE recipes of
+    each followed author that is fanned out.
+
+    Returns the number of stored entries.
+    """
+    latest = {}
+    for author_id, recipe_id in Recipe.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).order_by('author_id', '-id').values_list(
+        'author_id', 'id'
+    ).iterator(chunk_size=BATCH_SIZE):
+        recipe_ids = latest.setdefault(author_id, [])
+        if len(recipe_ids) < settings.FEED_BACKFILL_SIZE:
+            recipe_ids.append(recipe_id)
+
+    entries = [
+        FeedEntry(user_id=user_id, recipe_id=recipe_id)
+        for user_id, author_id in Subscribe.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=BATCH_SIZE)
+        for recipe_id in latest.get(author_id, ())
+    ]
+    FeedEntry.objects.all().delete()
+    FeedEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    return len(entries)
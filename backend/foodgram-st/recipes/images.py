@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from .models import Recipe
+from .thumbnails import render_thumbnails
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'images/recipes/thumbnails'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def schedule_thumbnails(recipe_id):
+    """Render thumbnails of the recipe image outside the request.
+
+    With IMAGE_WORKERS = 0 rendering runs in the calling thread. Failures
+    are logged and never reach the caller: the original image is already
+    saved and thumbnails can be rebuilt with generate_recipe_thumbnails.
+    """
+    try:
+        _schedule_thumbnails(recipe_id)
+    except Exception:
+        logger.exception(
+            'Could not schedule thumbnails for recipe %s', recipe_id
+        )
+
+
+def generate_thumbnails(recipe):
+    """Render and save thumbnails of the recipe image in this thread."""
+    _save_thumbnails(
+        recipe.pk, recipe.image.name, render_thumbnails(_read_image(recipe))
+    )
+
+
+def _read_image(recipe):
+    with recipe.image.open('rb') as image:
+        return image.read()
+
+
+def _schedule_thumbnails(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+
+    if not settings.IMAGE_WORKERS:
+        generate_thumbnails(recipe)
+        return
+
+    future = _get_executor().submit(render_thumbnails, _read_image(recipe))
+    future.add_done_callback(
+        partial(_on_rendered, recipe_id, recipe.image.name)
+    )
+
+
+def _on_rendered(recipe_id, image_name, future):
+    try:
+        _save_thumbnails(recipe_id, image_name, future.result())
+    except Exception:
+        logger.exception(
+            'Could not render thumbnails for recipe %s', recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def _save_thumbnails(recipe_id, image_name, rendered):
+    recipe = Recipe.objects.filter(pk=recipe_id, image=image_name).first()
+    if recipe is None:
+        # The recipe was deleted or got a new image meanwhile.
+        return
+
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    thumbnails = {}
+    for (size_name, format_name), content in rendered.items():
+        name = default_storage.save(
+            f'{THUMBNAILS_DIR}/{stem}_{size_name}.{format_name}',
+            ContentFile(content)
+        )
+        thumbnails.setdefault(size_name, {})[format_name] = name
+
+    previous = recipe.image_thumbnails
+    recipe.image_thumbnails = thumbnails
+    recipe.save(update_fields=['image_thumbnails'])
+
+    for formats in previous.values():
+        for name in formats.values():
+            default_storage.delete(name)
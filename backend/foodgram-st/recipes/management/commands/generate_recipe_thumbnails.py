@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Render list and detail thumbnails of recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render thumbnails of recipes that already have them",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").only("image")
+        if not options["all"]:
+            recipes = recipes.filter(image_thumbnails={})
+
+        rendered = failed = 0
+        for recipe in recipes.iterator():
+            try:
+                generate_thumbnails(recipe)
+            except Exception as e:
+                failed += 1
+                self.stdout.write(
+                    self.style.ERROR(f"Recipe {recipe.pk}: {str(e)}")
+                )
+            else:
+                rendered += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered thumbnails for {rendered} recipes, "
+                f"{failed} failed"
+            )
+        )
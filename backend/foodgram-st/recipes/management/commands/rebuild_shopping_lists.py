@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = "Recompute materialized shopping lists from carts and recipes"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            items = rebuild_shopping_lists()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt shopping lists: {items} items")
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import FAVORITES, RECIPES, USERS, invalidate
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount favorites, shopping cart, recipe and follower counters "
+        "from the related rows"
+    )
+
+    def handle(self, *args, **options):
+        corrected_rows = reconcile_counters()
+        if any(corrected_rows.values()):
+            # Counters are shown with recipes and authors and order
+            # ?ordering=-favorites_count.
+            invalidate(RECIPES, FAVORITES, USERS)
+        for counter, corrected in corrected_rows.items():
+            self.stdout.write(
+                self.style.SUCCESS(f"{counter}: corrected {corrected} rows")
+            )
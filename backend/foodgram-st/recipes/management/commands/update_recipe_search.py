@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import RECIPES, invalidate
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute full-text search vectors of all recipes, e.g. after "
+        "ingredients were renamed"
+    )
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors()
+        if updated:
+            invalidate(RECIPES)
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated search vectors of {updated} recipes")
+        )
@@ -0,0 +1,127 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import DERIVED_RECIPE_FIELDS, RecipeIngredient
+
+BUILD_CHUNK_SIZE = 10000
+
+
+class RecipeMatcher:
+    """In-process inverted index from ingredients to the recipes using them.
+
+    Every ingredient maps to a sorted array of recipe ids, so matching a
+    set of ingredients only walks their posting lists instead of joining
+    and grouping RecipeIngredient. The index is built lazily; committed
+    recipe writes in this process update the postings of that recipe
+    only. Other worker processes pick changes up after RECIPE_MATCHER_TTL
+    seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._recipes = {}
+        self._built_at = None
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self._built_at = None
+
+    def refresh_on_commit(self, instance, update_fields=None, **kwargs):
+        """Receiver for saves and deletes of Recipe and RecipeIngredient.
+
+        Ingredient rows are written in bulk without signals, so a save of
+        the recipe itself also reloads its ingredients.
+        """
+        # Derived columns have no bearing on the ingredients of the recipe.
+        if update_fields and DERIVED_RECIPE_FIELDS.issuperset(update_fields):
+            return
+        recipe_id = getattr(instance, 'recipe_id', instance.pk)
+        transaction.on_commit(partial(self.refresh, recipe_id))
+
+    def refresh(self, recipe_id):
+        """Replace the postings of one recipe with its rows in the
+        database, dropping it when it has no ingredients left."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            ingredient_ids = array('q', sorted(set(
+                RecipeIngredient.objects.filter(
+                    recipe_id=recipe_id
+                ).values_list('ingredient_id', flat=True)
+            )))
+            previous = self._recipes.get(recipe_id, array('q'))
+            # Arrays are replaced rather than changed in place, match
+            # may be walking them without the lock.
+            for ingredient_id in set(previous).difference(ingredient_ids):
+                postings = array('q', self._postings[ingredient_id])
+                del postings[bisect_left(postings, recipe_id)]
+                if postings:
+                    self._postings[ingredient_id] = postings
+                else:
+                    del self._postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids).difference(previous):
+                postings = array(
+                    'q', self._postings.get(ingredient_id, array('q'))
+                )
+                insort(postings, recipe_id)
+                self._postings[ingredient_id] = postings
+            if ingredient_ids:
+                self._recipes[recipe_id] = ingredient_ids
+            else:
+                self._recipes.pop(recipe_id, None)
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Recipes using any of the ingredients as (recipe_id, missing)
+        pairs: fully cookable first, then by fewest missing ingredients,
+        newer recipes first among equals."""
+        postings, recipes = self._get_index()
+        found = Counter()
+        for ingredient_id in set(ingredient_ids):
+            found.update(postings.get(ingredient_id, ()))
+
+        matches = []
+        for recipe_id, count in found.items():
+            ingredients = recipes.get(recipe_id)
+            if ingredients is None:
+                continue
+            missing = max(len(ingredients) - count, 0)
+            if max_missing is None or missing <= max_missing:
+                matches.append((missing, -recipe_id))
+        matches.sort()
+        return [(-recipe_id, missing) for missing, recipe_id in matches]
+
+    def _get_index(self):
+        ttl = getattr(settings, 'RECIPE_MATCHER_TTL', 300)
+        with self._lock:
+            if (
+                self._built_at is None
+                or time.monotonic() - self._built_at > ttl
+            ):
+                postings = {}
+                recipes = {}
+                rows = RecipeIngredient.objects.order_by(
+                    'ingredient_id', 'recipe_id'
+                ).values_list('ingredient_id', 'recipe_id')
+                for ingredient_id, recipe_id in rows.iterator(
+                    chunk_size=BUILD_CHUNK_SIZE
+                ):
+                    postings.setdefault(ingredient_id, array('q')).append(
+                        recipe_id
+                    )
+                    recipes.setdefault(recipe_id, array('q')).append(
+                        ingredient_id
+                    )
+                self._postings = postings
+                self._recipes = recipes
+                self._built_at = time.monotonic()
+            return self._postings, self._recipes
+
+
+recipe_matcher = RecipeMatcher()
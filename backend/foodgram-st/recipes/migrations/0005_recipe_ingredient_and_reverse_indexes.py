@@ -0,0 +1,67 @@
+# Generated by Django 4.1.7 on 2026-10-18 06:09
+
+from django.db import migrations, models
+from django.db.models import Min, Sum
+
+# RecipeIngredient.MAX_AMOUNT at the time of this migration.
+MAX_AMOUNT = 32_000
+
+
+def delete_duplicate_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = RecipeIngredient.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        first_id=Min('id'), rows=models.Count('id'), total=Sum('amount')
+    ).filter(rows__gt=1)
+    for duplicate in duplicates:
+        # The kept row carries the whole amount the recipe asked for.
+        RecipeIngredient.objects.filter(id=duplicate['first_id']).update(
+            amount=min(duplicate['total'], MAX_AMOUNT)
+        )
+        RecipeIngredient.objects.filter(
+            recipe=duplicate['recipe'],
+            ingredient=duplicate['ingredient']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+        'ON recipes_recipe USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_created'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shopping_cart_recipe_user_idx'),
+        ),
+        migrations.RunPython(
+            delete_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe-ingredient_recipe_ingredient'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
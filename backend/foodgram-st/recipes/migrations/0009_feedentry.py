@@ -0,0 +1,62 @@
+# Generated by Django 4.1.7 on 2026-10-18 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def backfill_feeds(apps, schema_editor):
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+
+    latest = {}
+    for author_id, recipe_id in Recipe.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).order_by('author_id', '-id').values_list(
+        'author_id', 'id'
+    ).iterator(chunk_size=BATCH_SIZE):
+        recipe_ids = latest.setdefault(author_id, [])
+        if len(recipe_ids) < settings.FEED_BACKFILL_SIZE:
+            recipe_ids.append(recipe_id)
+
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id)
+            for user_id, author_id in Subscribe.objects.values_list(
+                'user_id', 'author_id'
+            ).iterator(chunk_size=BATCH_SIZE)
+            for recipe_id in latest.get(author_id, ())
+        ),
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed-entry_user_recipe'),
+        ),
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:12
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def spread_tied_created(apps, schema_editor):
+    """0004 gave every existing recipe the same created value. Step the
+    tied rows apart by a microsecond in id order, so the newest first
+    ordering and its index keep telling them apart."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    tied = Recipe.objects.order_by().values('created').annotate(
+        count=Count('id')
+    ).filter(count__gt=1).values_list('created', flat=True)
+    for created in list(tied):
+        recipes = list(
+            Recipe.objects.filter(created=created).order_by('-id').only(
+                'id', 'created'
+            )
+        )
+        for step, recipe in enumerate(recipes):
+            recipe.created = created - timedelta(microseconds=step)
+        Recipe.objects.bulk_update(
+            recipes, ['created'], batch_size=BATCH_SIZE
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_tied_created, migrations.RunPython.noop),
+    ]
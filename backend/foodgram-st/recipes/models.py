@@ -1,8 +1,16 @@
 from users.models import CustomUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from ingredients.models import Ingredient
 from django.db import models
 
+# Recipe columns written in the background or as counters, apart from
+# what the author edits.
+DERIVED_RECIPE_FIELDS = frozenset((
+    'image_thumbnails', 'favorites_count', 'shopping_cart_count',
+    'search_vector'
+))
+
 
 class Recipe(models.Model):
     MIN_COOKING_TIME = 1
@@ -43,10 +51,46 @@ class Recipe(models.Model):
         upload_to='images/recipes',
         verbose_name='Фотография рецепта',
     )
+    image_thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюры фотографии рецепта'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата публикации'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый индекс'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -78,6 +122,12 @@ class RecipeIngredient(models.Model):
 
     class Meta:
         verbose_name = 'Сопоставление рецепта и ингредиента'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe-ingredient_recipe_ingredient'
+            )
+        ]
 
 
 class Favorite(models.Model):
@@ -102,6 +152,12 @@ class Favorite(models.Model):
                 name='unique_favorite_user_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} хранит в избранном {self.recipe}'
@@ -129,7 +185,75 @@ class ShoppingCart(models.Model):
                 name='unique_shopping-cart_user_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx'
+            )
+        ]
         verbose_name_plural = 'Списки покупок'
 
     def __str__(self):
         return f'{self.user} хранит в списке покупок {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Ingredient total of a user's shopping cart, kept up to date on every
+    cart and recipe change so the list is read without aggregation."""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping-list-item_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
+class FeedEntry(models.Model):
+    """A recipe in the feed of one of its author's followers."""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed-entry_user_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,91 @@
+"""Full-text search over recipe names, descriptions and ingredient names.
+
+On PostgreSQL every recipe keeps a weighted tsvector in
+Recipe.search_vector, refreshed whenever the recipe is written and backed
+by a GIN index. Other databases fall back to substring matching, which is
+enough for local runs.
+"""
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connections
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When
+)
+from django.db.models.functions import Cast
+
+from .models import Recipe, RecipeIngredient
+
+
+def _is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def _search_vector():
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(ingredient_names, weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_search_vectors(recipes=None):
+    """Recompute search vectors of the given recipes (all by default)."""
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    if not _is_postgresql(recipes):
+        return 0
+    return recipes.update(search_vector=_search_vector())
+
+
+def search_recipes(queryset, query):
+    """Recipes matching the query, annotated with search_rank."""
+    if _is_postgresql(queryset):
+        search_query = SearchQuery(
+            query,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        # ts_rank returns real, double precision keeps cursor positions
+        # exact when they are compared back against the rank.
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), search_query), FloatField()
+            )
+        )
+
+    in_ingredients = Exists(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=query
+        )
+    )
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query) | in_ingredients
+    ).annotate(
+        search_rank=Case(
+            When(name__icontains=query, then=Value(1.0)),
+            When(in_ingredients, then=Value(0.4)),
+            default=Value(0.2),
+            output_field=FloatField()
+        )
+    )
@@ -0,0 +1,286 @@
+"""Maintenance of the materialized shopping lists (ShoppingListItem).
+
+Every change of a cart or of the ingredients of a recipe that sits in
+carts is applied as a per-ingredient delta, so reading a list never
+aggregates RecipeIngredient. Deltas are computed when the change is
+written and applied once its transaction commits.
+
+Saves and deletes of ShoppingCart and RecipeIngredient, cascades and admin
+edits included, reach the receivers below. Bulk writes send no signals and
+call add_recipes and change_recipe themselves. Raw SQL is fixed by
+rebuild_shopping_lists.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Sum
+
+from users.models import CustomUser
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+_current_batch = ContextVar('shopping_list_batch', default=None)
+
+
+class _Batch:
+    def __init__(self):
+        # user_id -> ingredient_id -> delta
+        self.deltas = defaultdict(Counter)
+        # recipe_id -> Counter of ingredient amounts / set of cart owners,
+        # kept up to date by the changes made inside the block.
+        self.amounts = {}
+        self.cart_users = {}
+
+
+@contextmanager
+def batch(recipe_ids=()):
+    """Merge the list changes made inside the block into one write
+    applied on commit.
+
+    Deleting a recipe or many cart rows sends a signal per row; inside a
+    batch the rows of each recipe are read once and then followed in
+    memory. Amounts of recipe_ids are read upfront in one query. Nothing
+    is applied when the block raises.
+    """
+    if _current_batch.get() is not None:
+        yield
+        return
+    current = _Batch()
+    token = _current_batch.set(current)
+    try:
+        _get_amounts(recipe_ids)
+        yield
+    finally:
+        _current_batch.reset(token)
+    _schedule(current.deltas)
+
+
+def _get_amounts(recipe_ids):
+    """{recipe_id: Counter({ingredient_id: amount})}"""
+    current = _current_batch.get()
+    known = current.amounts if current is not None else {}
+    missing = set(recipe_ids).difference(known)
+    if missing:
+        loaded = {recipe_id: Counter() for recipe_id in missing}
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=missing
+        ).values_list('recipe_id', 'ingredient_id', 'amount')
+        for recipe_id, ingredient_id, amount in rows:
+            loaded[recipe_id][ingredient_id] += amount
+        known.update(loaded)
+    return {recipe_id: known[recipe_id] for recipe_id in recipe_ids}
+
+
+def _get_cart_users(recipe_id):
+    current = _current_batch.get()
+    known = current.cart_users if current is not None else {}
+    if recipe_id not in known:
+        known[recipe_id] = set(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True)
+        )
+    return known[recipe_id]
+
+
+def _schedule(deltas):
+    """Apply {user_id: {ingredient_id: delta}} with the enclosing batch,
+    or once the current transaction commits; nothing is applied if it
+    rolls back."""
+    deltas = {
+        user_id: {
+            ingredient_id: delta
+            for ingredient_id, delta in user_deltas.items() if delta
+        }
+        for user_id, user_deltas in deltas.items()
+    }
+    deltas = {
+        user_id: user_deltas
+        for user_id, user_deltas in deltas.items() if user_deltas
+    }
+    if not deltas:
+        return
+    current = _current_batch.get()
+    if current is not None:
+        for user_id, user_deltas in deltas.items():
+            current.deltas[user_id].update(user_deltas)
+        return
+    transaction.on_commit(partial(apply_deltas, deltas))
+
+
+@transaction.atomic
+def apply_deltas(deltas):
+    """Add {user_id: {ingredient_id: amount}} to the lists of the users,
+    dropping items that reach zero."""
+    # Lock the owners in a fixed order so concurrent changes of the same
+    # list are applied one after another instead of losing updates.
+    # Users deleted meanwhile have no list left to change.
+    user_ids = list(
+        CustomUser.objects.select_for_update().filter(
+            pk__in=deltas
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+    if not user_ids:
+        return
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=set().union(
+                *(deltas[user_id] for user_id in user_ids)
+            )
+        )
+    }
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas[user_id].items():
+            item = existing.get((user_id, ingredient_id))
+            if item is None:
+                if delta > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=delta
+                    ))
+            elif item.amount + delta > 0:
+                item.amount += delta
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+
+    if to_delete:
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        ShoppingListItem.objects.bulk_update(
+            to_update, ['amount'], batch_size=BATCH_SIZE
+        )
+    if to_create:
+        ShoppingListItem.objects.bulk_create(
+            to_create, batch_size=BATCH_SIZE
+        )
+
+
+def _change_cart(user_id, recipe_ids, sign):
+    current = _current_batch.get()
+    deltas = Counter()
+    for recipe_id, amounts in _get_amounts(recipe_ids).items():
+        for ingredient_id, amount in amounts.items():
+            deltas[ingredient_id] += sign * amount
+        if current is not None and recipe_id in current.cart_users:
+            if sign > 0:
+                current.cart_users[recipe_id].add(user_id)
+            else:
+                current.cart_users[recipe_id].discard(user_id)
+    _schedule({user_id: deltas})
+
+
+def add_recipes(user_id, recipe_ids):
+    """Recipes were put into the user's cart."""
+    _change_cart(user_id, recipe_ids, 1)
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Recipes were taken out of the user's cart."""
+    _change_cart(user_id, recipe_ids, -1)
+
+
+def change_recipe(recipe_id, deltas):
+    """Ingredient amounts of a recipe changed by {ingredient_id: delta};
+    updates the list of everyone who has it in the cart."""
+    if not any(deltas.values()):
+        return
+    current = _current_batch.get()
+    if current is not None and recipe_id in current.amounts:
+        current.amounts[recipe_id].update(deltas)
+    _schedule({
+        user_id: deltas for user_id in _get_cart_users(recipe_id)
+    })
+
+
+def _remember_stored_row(sender, instance, raw=False, **kwargs):
+    """pre_save receiver: an update replaces the row as it is stored."""
+    if raw or instance._state.adding:
+        instance._shopping_list_stored = None
+        return
+    instance._shopping_list_stored = sender.objects.filter(
+        pk=instance.pk
+    ).first()
+
+
+def _cart_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_shopping_list_stored', None)
+    if stored is not None:
+        if (stored.user_id, stored.recipe_id) == (
+            instance.user_id, instance.recipe_id
+        ):
+            return
+        remove_recipes(stored.user_id, [stored.recipe_id])
+    add_recipes(instance.user_id, [instance.recipe_id])
+
+
+def _cart_deleted(sender, instance, **kwargs):
+    remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+def _recipe_ingredient_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = {instance.ingredient_id: instance.amount}
+    stored = getattr(instance, '_shopping_list_stored', None)
+    if stored is not None and stored.recipe_id == instance.recipe_id:
+        deltas[stored.ingredient_id] = (
+            deltas.get(stored.ingredient_id, 0) - stored.amount
+        )
+    elif stored is not None:
+        change_recipe(stored.recipe_id, {
+            stored.ingredient_id: -stored.amount
+        })
+    change_recipe(instance.recipe_id, deltas)
+
+
+def _recipe_ingredient_deleted(sender, instance, **kwargs):
+    change_recipe(instance.recipe_id, {
+        instance.ingredient_id: -instance.amount
+    })
+
+
+# (model, pre_save, post_save, post_delete)
+RECEIVERS = (
+    (ShoppingCart, _remember_stored_row, _cart_saved, _cart_deleted),
+    (
+        RecipeIngredient, _remember_stored_row,
+        _recipe_ingredient_saved, _recipe_ingredient_deleted
+    ),
+)
+
+
+def rebuild_shopping_lists():
+    """Recompute every list from carts and recipe ingredients.
+
+    Returns the number of stored items.
+    """
+    totals = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+
+    items = [
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for user_id, ingredient_id, amount in totals.iterator()
+    ]
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+    return len(items)
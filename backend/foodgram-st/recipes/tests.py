@@ -0,0 +1,368 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ingredients.models import Ingredient
+from recipes import shopping_list
+from recipes.matching import RecipeMatcher, recipe_matcher
+from recipes.models import (
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem
+)
+from users.models import CustomUser
+
+
+def create_user(index):
+    return CustomUser.objects.create(
+        username=f'user{index}',
+        email=f'user{index}@example.com',
+        first_name='Имя',
+        last_name='Фамилия'
+    )
+
+
+def create_recipe(author, index, amounts):
+    """A recipe with {ingredient: amount}."""
+    recipe = Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {index}',
+        text='Описание',
+        cooking_time=10,
+        image='images/recipes/test.png'
+    )
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in amounts.items()
+    ])
+    return recipe
+
+
+class ShoppingListTests(TestCase):
+    """The stored lists must always equal the sum of the ingredients of
+    the recipes in the carts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.other_user = create_user(1)
+        cls.author = create_user(2)
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(4)
+        ]
+        first, second, third, fourth = cls.ingredients
+        cls.recipes = [
+            create_recipe(cls.author, 0, {first: 100, second: 2}),
+            create_recipe(cls.author, 1, {first: 50, third: 7}),
+            create_recipe(cls.other_user, 2, {second: 3, fourth: 1}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListsMatchCarts(self):
+        totals = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).values_list(
+            'recipe__shopping_cart__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in totals
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        self.assertEqual(stored, expected)
+
+    def put_into_carts(self):
+        """Everyone has every recipe in the cart."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in (self.user, self.other_user):
+                for recipe in self.recipes:
+                    ShoppingCart.objects.create(user=user, recipe=recipe)
+        self.assertListsMatchCarts()
+
+    def test_api_add_and_remove(self):
+        first, second = self.recipes[:2]
+
+        for recipe in (first, second):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    f'/api/recipes/{recipe.pk}/shopping_cart/'
+                )
+            self.assertEqual(response.status_code, 201)
+        self.assertListsMatchCarts()
+        self.assertEqual(
+            ShoppingListItem.objects.get(
+                user=self.user, ingredient=self.ingredients[0]
+            ).amount,
+            150
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f'/api/recipes/{first.pk}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertListsMatchCarts()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.user, ingredient=self.ingredients[1]
+        ).exists())
+
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(
+            [(item['name'], item['amount']) for item in response.data],
+            [('ингредиент 0', 50), ('ингредиент 2', 7)]
+        )
+
+    def test_api_batch(self):
+        recipe_ids = [recipe.pk for recipe in self.recipes]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/shopping_cart/batch/',
+                {'recipes': recipe_ids},
+                format='json'
+            )
+        self.assertLess(response.status_code, 300)
+        self.assertListsMatchCarts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                '/api/recipes/shopping_cart/batch/',
+                {'recipes': recipe_ids[:2]},
+                format='json'
+            )
+        self.assertLess(response.status_code, 300)
+        self.assertListsMatchCarts()
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.user).count(), 2
+        )
+
+    def test_admin_style_edits(self):
+        self.put_into_carts()
+        row = RecipeIngredient.objects.get(
+            recipe=self.recipes[0], ingredient=self.ingredients[0]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            row.amount = 30
+            row.save()
+        self.assertListsMatchCarts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            row.ingredient = self.ingredients[3]
+            row.save()
+        self.assertListsMatchCarts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            row.recipe = self.recipes[1]
+            row.save()
+        self.assertListsMatchCarts()
+
+        cart = ShoppingCart.objects.get(
+            user=self.user, recipe=self.recipes[0]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.save()
+            cart.user = self.author
+            cart.save()
+        self.assertListsMatchCarts()
+
+    def test_cascades(self):
+        self.put_into_carts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[0].delete()
+        self.assertListsMatchCarts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        self.assertListsMatchCarts()
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.user).count(), 2
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_user.delete()
+        self.assertListsMatchCarts()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_api_recipe_update_and_delete(self):
+        self.put_into_carts()
+        recipe = self.recipes[2]
+        self.client.force_authenticate(self.other_user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'ingredients': [
+                    {'id': self.ingredients[1].pk, 'amount': 4},
+                    {'id': self.ingredients[2].pk, 'amount': 8},
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertListsMatchCarts()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertListsMatchCarts()
+
+    def test_nothing_is_applied_on_rollback(self):
+        self.put_into_carts()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    ShoppingCart.objects.filter(user=self.user).delete()
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertListsMatchCarts()
+
+    def test_rebuild(self):
+        self.put_into_carts()
+        ShoppingListItem.objects.filter(user=self.user).delete()
+        ShoppingListItem.objects.filter(
+            user=self.other_user
+        ).update(amount=1)
+
+        shopping_list.rebuild_shopping_lists()
+
+        self.assertListsMatchCarts()
+
+
+class RecipeMatcherTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(0)
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        first, second, third, fourth, _ = cls.ingredients
+        cls.recipes = [
+            create_recipe(cls.author, 0, {first: 1, second: 1}),
+            create_recipe(cls.author, 1, {first: 1}),
+            create_recipe(cls.author, 2, {first: 1, second: 1, third: 1}),
+            create_recipe(cls.author, 3, {fourth: 1}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        # The shared index may hold recipes of other tests.
+        recipe_matcher.invalidate()
+        self.matcher = RecipeMatcher()
+
+    def ids(self, *indexes):
+        return [self.ingredients[index].pk for index in indexes]
+
+    def test_cookable_first_then_fewest_missing(self):
+        first, second, third, _ = self.recipes
+
+        self.assertEqual(self.matcher.match(self.ids(0, 1, 0)), [
+            (second.pk, 0), (first.pk, 0), (third.pk, 1)
+        ])
+        self.assertEqual(
+            self.matcher.match(self.ids(0, 1), max_missing=0),
+            [(second.pk, 0), (first.pk, 0)]
+        )
+        self.assertEqual(self.matcher.match(self.ids(4)), [])
+
+    def test_refresh_replaces_postings_of_one_recipe(self):
+        first, second, third, _ = self.recipes
+        self.matcher.match(self.ids(0))
+
+        RecipeIngredient.objects.filter(recipe=second).delete()
+        RecipeIngredient.objects.create(
+            recipe=second, ingredient=self.ingredients[4], amount=1
+        )
+        self.matcher.refresh(second.pk)
+        RecipeIngredient.objects.filter(recipe=first).delete()
+        self.matcher.refresh(first.pk)
+
+        self.assertEqual(
+            self.matcher.match(self.ids(0, 1, 4)),
+            [(second.pk, 0), (third.pk, 1)]
+        )
+
+    def test_index_is_rebuilt_after_ttl(self):
+        with mock.patch('recipes.matching.time.monotonic', return_value=0):
+            self.matcher.match(self.ids(0))
+        RecipeIngredient.objects.filter(recipe=self.recipes[1]).delete()
+
+        with mock.patch('recipes.matching.time.monotonic', return_value=1):
+            self.assertIn((self.recipes[1].pk, 0), self.matcher.match(
+                self.ids(0)
+            ))
+        with mock.patch(
+            'recipes.matching.time.monotonic', return_value=10_000
+        ):
+            self.assertNotIn((self.recipes[1].pk, 0), self.matcher.match(
+                self.ids(0)
+            ))
+
+    def test_committed_writes_refresh_shared_index(self):
+        recipe = self.recipes[3]
+        recipe_matcher.match(self.ids(0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredients[0], amount=1
+            )
+        self.assertIn((recipe.pk, 1), recipe_matcher.match(self.ids(0)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertNotIn(
+            recipe.pk,
+            [recipe_id for recipe_id, _ in recipe_matcher.match(self.ids(0))]
+        )
+
+    def test_cookable_endpoint(self):
+        first, second, third, _ = self.recipes
+        ingredient_ids = self.ids(0, 1)
+
+        response = APIClient().get(
+            '/api/recipes/cookable/',
+            {'ingredients': ingredient_ids, 'max_missing': 1}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                (item['id'], item['missing_ingredients'])
+                for item in response.data['results']
+            ],
+            [(second.pk, 0), (first.pk, 0), (third.pk, 1)]
+        )
+
+    def test_cookable_endpoint_requires_ingredients(self):
+        client = APIClient()
+        for params in (
+            {},
+            {'ingredients': 'соль'},
+            {'ingredients': self.ids(0), 'max_missing': -1},
+        ):
+            with self.subTest(params=params):
+                response = client.get('/api/recipes/cookable/', params)
+                self.assertEqual(response.status_code, 400)
@@ -0,0 +1,41 @@
+"""Thumbnail rendering run inside image worker processes.
+
+The module imports nothing from Django so that spawned workers can load
+it without configuring settings.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = {
+    'list': (480, 480),
+    'detail': (1024, 1024),
+}
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def render_thumbnails(data):
+    """Return {(size, format): encoded bytes} for every thumbnail."""
+    with Image.open(io.BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', source.size, 'white')
+            background.paste(
+                source, mask=source.convert('RGBA').getchannel('A')
+            )
+            source = background
+
+        rendered = {}
+        for size_name, size in THUMBNAIL_SIZES.items():
+            thumbnail = source.copy()
+            thumbnail.thumbnail(size, Image.LANCZOS)
+            for format_name, (pil_format, options) in (
+                THUMBNAIL_FORMATS.items()
+            ):
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, pil_format, **options)
+                rendered[size_name, format_name] = buffer.getvalue()
+        return rendered
@@ -11,6 +11,8 @@ class AdminCustomUser(UserAdmin):
         'username',
         'first_name',
         'email',
+        'recipes_count',
+        'followers_count',
         'is_staff'
     )
     ordering = ('email',)
@@ -37,6 +37,16 @@ class CustomUser(AbstractUser):
         upload_to='images/custom_users',
         null=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     REQUIRED_FIELDS = [
         'username',
@@ -74,6 +84,16 @@ class Subscribe(models.Model):
                 name='unique_subscribe_user_author'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscribe_author_user_idx'
+            ),
+            models.Index(
+                fields=['user', 'id'],
+                name='subscribe_user_id_idx'
+            ),
+        ]
         verbose_name_plural = 'Подписки'
 
     def __str__(self):